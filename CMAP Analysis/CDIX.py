@@ -1,9 +1,9 @@
 import numpy as np
 from plotly.subplots import make_subplots
-from sklearn.mixture import GaussianMixture as GMM
 import plotly.graph_objects as go
 import scipy.signal as signal
 from scipy.stats import norm
+from CDIXBatch import CDIXBatch
 
 class CDIX:
     def __init__(self, DataStims, DataAmps, Mean_LS=1.75, PlotResult=False):
@@ -23,11 +23,32 @@ class CDIX:
         try:
             self.MidStims, self.MidAmps = self._segment_data()
             S = self._GMM(Mean_LS)
-            G, NDivs, CDIX, D = self._find_CDIX_params(S)
+            G, NDivs, CDIX, D = self._find_CDIX_params(S, self.GMM_weights, self.GMM_means, self.GMM_std_dev)
         except:
             return np.nan, np.nan, np.nan, S, np.nan
         return G, NDivs, CDIX, S, D
 
+    def sweep(self, Mean_LS_values):
+        """
+        Return G, NDivs and CDIX arrays aligned to Mean_LS_values, reusing this scan's segmentation and step sizes.
+        Only the mixture fit (batched over all values) and the grid stage are evaluated per value.
+        """
+        Mean_LS_values=np.asarray(Mean_LS_values, dtype=float)
+        G=np.full(len(Mean_LS_values), np.nan)
+        NDivs=np.full(len(Mean_LS_values), np.nan)
+        CDIX=np.full(len(Mean_LS_values), np.nan)
+
+        if not hasattr(self, "MidAmps"):
+            return G, NDivs, CDIX       # segmentation failed, so every value fails
+
+        try:
+            Weights, Means, Stds = self._fit_mixtures(self.S, Mean_LS_values)
+        except Exception:
+            return G, NDivs, CDIX
+
+        # Every value digitizes the same MidAmps on its own grid: one ragged batch
+        Batch = CDIXBatch.from_scans([self.MidAmps]*len(Mean_LS_values), Weights, Means, Stds)
+        return Batch.G, Batch.NDivs, Batch.CDIX
 
 
     def _segment_data(self):
@@ -66,99 +87,75 @@ class CDIX:
         """Gaussian Mixed Modeling Step"""
         MidAmps=self.MidAmps
 
-        S=np.array([])
-        for i in range(len(MidAmps)-1):
-            S=np.append(S,abs(MidAmps[i]-MidAmps[i+1]))
-
-
-        S_SS=np.append(S,-S)
-
-        Std_LS=(1/3)*Mean_LS
-        Std_SS=(1/5)*Std_LS
-
-        means_init = np.array([Mean_LS, -Mean_LS, 0]).reshape(-1, 1) # replace with your initial means
-
-        # initial standard deviations
-        std_init = np.array([Std_LS, Std_LS, Std_SS]) # replace with your initial standard deviations
-
-        # initial weights
-        weights_init = np.array([0.33, 0.33, 0.34]) # REMOVE AND TEST LATER
-
-        # initial precisions (inverse of variance)
-        precisions_init = 1 / np.square(std_init).reshape(-1, 1, 1)
+        S=np.abs(np.diff(MidAmps))
 
-        # model creation
-        gmm = GMM(n_components=3, 
-                            means_init=means_init, 
-                            precisions_init=precisions_init, 
-                            weights_init=weights_init, 
-                            tol=0.01) 
+        Weights, Means, Stds = self._fit_mixtures(S, np.array([Mean_LS]))
 
-        # fit the model
-        gmm.fit(S_SS.reshape(-1,1))
-
-        # get the final means
-        final_means = gmm.means_
-
-        # get the final standard deviations
-        final_std_dev = np.sqrt(gmm.covariances_)
-
-        # get the final weights
-        self.GMM_weights = gmm.weights_
-
-        self.GMM_means = final_means.ravel()
-        self.GMM_std_dev = final_std_dev.ravel()
+        self.GMM_weights = Weights[0]
+        self.GMM_means = Means[0]
+        self.GMM_std_dev = Stds[0]
 
         return S
-    
-    def _find_CDIX_params(self,S):
-        # G_LS=self.GMM_weights[0]*norm.pdf(S, self.GMM_means[0], self.GMM_std_dev[0])
-        # G_SS=self.GMM_weights[2]*norm.pdf(S, self.GMM_means[2], self.GMM_std_dev[2])
-        # bools=G_LS>G_SS
-
-        # try:
-        #     G=min(S[bools])
-        # except:
-        # X_int=np.linspace(0,10*max(S),10000)
-        # G_LS=self.GMM_weights[0]*norm.pdf(X_int, self.GMM_means[0], self.GMM_std_dev[0])
-        # G_SS=self.GMM_weights[2]*norm.pdf(X_int, self.GMM_means[2], self.GMM_std_dev[2])
-        # bools=G_LS>G_SS
-        l=self._solve_intersect(self.GMM_means[0],self.GMM_means[2],self.GMM_std_dev[0],self.GMM_std_dev[2],self.GMM_weights[0],self.GMM_weights[2])
-        while True:
-            if l.size<=0:
-                print('bruh')
-                self.GMM_weights[0]*=2
-                l=self._solve_intersect(self.GMM_means[0],self.GMM_means[2],self.GMM_std_dev[0],self.GMM_std_dev[2],self.GMM_weights[0],self.GMM_weights[2])
-            else:
-                break
-
-        G=min([i for i in l if i > 0])
-        #G=min(X_int[bools])
-        D=np.array([])
-
-        for i in self.MidAmps:
-            D=np.append(D,np.floor(i/G))
-        L=len(D)
-        NDiv=max(D)-min(D)+1
-
-        H_arr=np.array([])
-        for i in np.arange(min(D),max(D)+1):
-            Fi=np.count_nonzero(D==i)
-            if Fi>0:
-                H_arr=np.append(H_arr,(Fi/L)*np.log2(Fi/L))
 
+    def _fit_mixtures(self, S, Mean_LS, tol=0.01, max_iter=100, reg_covar=1e-6):
+        """
+        Fit the LS, mirrored LS and SS components to the mirrored step sizes by 1-D EM, once per Mean_LS value.
+        Follows sklearn's GaussianMixture (full covariance, given initial weights, means and precisions) with Mean_LS
+        as a batch dimension; returns weights, means and standard deviations of shape (len(Mean_LS), 3).
+        """
+        X=np.append(S,-S)
+        N=len(X)
+        B=len(Mean_LS)
 
-        H=-np.sum(H_arr)
-        CDIX=2**H
+        Std_LS=(1/3)*Mean_LS
+        Std_SS=(1/5)*Std_LS
 
-        return G,NDiv,CDIX,D
+        Means=np.stack([Mean_LS, -Mean_LS, np.zeros(B)], axis=1)
+        Stds=np.stack([Std_LS, Std_LS, Std_SS], axis=1)
+        Weights=np.tile([0.33, 0.33, 0.34], (B, 1))
+        PrecChol=1/Stds
+
+        LowerBound=np.full(B, -np.inf)
+        Active=np.ones(B, dtype=bool)
+        for _ in range(max_iter):
+            # E-step: log responsibilities of every point, per initialization
+            LogProb=-0.5*(np.log(2*np.pi)+np.square((X[None,:,None]-Means[Active,None,:])*PrecChol[Active,None,:]))+np.log(PrecChol[Active,None,:])
+            Weighted=LogProb+np.log(Weights[Active,None,:])
+            Max=Weighted.max(axis=2, keepdims=True)
+            LogNorm=Max+np.log(np.exp(Weighted-Max).sum(axis=2, keepdims=True))
+            Resp=np.exp(Weighted-LogNorm)
+
+            # M-step: closed-form weights, means and variances
+            Nk=Resp.sum(axis=1)+10*np.finfo(Resp.dtype).eps
+            Mk=np.einsum('bnk,n->bk', Resp, X)/Nk
+            Var=np.einsum('bnk,bnk->bk', Resp, np.square(X[None,:,None]-Mk[:,None,:]))/Nk+reg_covar
+            Weights[Active]=Nk/N
+            Means[Active]=Mk
+            Stds[Active]=np.sqrt(Var)
+            PrecChol[Active]=1/Stds[Active]
+
+            # Stop each initialization once the mean log-likelihood changes by less than tol
+            Bound=LogNorm[:,:,0].mean(axis=1)
+            Done=np.abs(Bound-LowerBound[Active])<tol
+            LowerBound[Active]=Bound
+            Active[np.flatnonzero(Active)[Done]]=False
+            if not Active.any():
+                break
 
-    def _solve_intersect(self,m1,m2,std1,std2,s1,s2):
-        a = 1/(2*std1**2) - 1/(2*std2**2)
-        b = m2/(std2**2) - m1/(std1**2)
-        c = m1**2 /(2*std1**2) - m2**2 / (2*std2**2) - np.log((std2*s1)/(std1*s2))
-        r=np.roots([a,b,c])
-        return r[np.isreal(r)]
+        return Weights, Means, Stds
+    
+    def _find_CDIX_params(self,S,Weights,Means,Stds):
+        Batch=CDIXBatch(self.MidAmps,[0,len(self.MidAmps)],Weights[None],Means[None],Stds[None])
+        if not Batch.Converged[0]:
+            raise ValueError("LS and SS components do not intersect")
+        Weights[0]*=2**Batch.Doublings[0]       # the LS weight that made the components intersect
+
+        G=Batch.G[0]
+        if np.isnan(G):
+            raise ValueError("No positive intersection of the LS and SS components")
+        D=np.floor(self.MidAmps/G)
+
+        return G,Batch.NDivs[0],Batch.CDIX[0],D
 
     def _generate_plot(self):
 
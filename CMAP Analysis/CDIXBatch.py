@@ -0,0 +1,103 @@
+import numpy as np
+
+class CDIXBatch:
+    def __init__(self, MidAmps, Offsets, Weights, Means, Stds, MaxDoublings=1000):
+        """
+        Grid stage of CDIX for many scans at once.
+        MidAmps holds the mid-scan amplitudes of every scan concatenated, scan i being MidAmps[Offsets[i]:Offsets[i+1]];
+        Weights, Means and Stds are the (scans x 3) LS, mirrored LS and SS mixture parameters.
+        """
+        self.MidAmps = np.asarray(MidAmps, dtype=float)
+        self.Offsets = np.asarray(Offsets, dtype=np.intp)
+        self.Lengths = np.diff(self.Offsets)
+
+        Weights = np.asarray(Weights, dtype=float)
+        Means = np.asarray(Means, dtype=float)
+        Stds = np.asarray(Stds, dtype=float)
+
+        self.G, self.Doublings, self.Converged = self._find_gridsize(Means[:,0], Means[:,2], Stds[:,0], Stds[:,2], Weights[:,0], Weights[:,2], MaxDoublings)
+        self.NDivs, self.CDIX = self._calculate_CDIX(self.G)
+
+    @classmethod
+    def from_scans(cls, MidAmpsList, Weights, Means, Stds, MaxDoublings=1000):
+        """Pack a list of MidAmps arrays into one ragged batch."""
+        Offsets = np.concatenate([[0], np.cumsum([len(MidAmps) for MidAmps in MidAmpsList])])
+        MidAmps = np.concatenate(MidAmpsList) if len(MidAmpsList) else np.empty(0)
+        return cls(MidAmps, Offsets, Weights, Means, Stds, MaxDoublings)
+
+    def _find_gridsize(self, m1, m2, std1, std2, s1, s2, MaxDoublings):
+        """
+        Smallest positive intersection of the weighted LS and SS components, per scan.
+        Where the components do not intersect, the LS weight is doubled until they do; the number of doublings is
+        found analytically and capped at MaxDoublings, and scans without a real intersection report Converged False.
+        """
+        a = 1/(2*std1**2) - 1/(2*std2**2)
+        b = m2/(std2**2) - m1/(std1**2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c = m1**2 /(2*std1**2) - m2**2 / (2*std2**2) - np.log((std2*s1)/(std1*s2))
+
+        # Doubling s1 lowers c by log(2): with a > 0 the discriminant b^2 - 4a(c - n log2) turns non-negative at a known n
+        Quadratic = a != 0
+        Disc = b**2 - 4*a*c
+        Doublings = np.zeros(len(a), dtype=np.intp)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Needed = np.ceil((c - b**2/(4*a))/np.log(2))
+        Grow = Quadratic & (Disc < 0) & (a > 0)
+        Doublings[Grow] = np.clip(np.nan_to_num(Needed[Grow], nan=MaxDoublings+1, posinf=MaxDoublings+1), 0, MaxDoublings+1)
+        c = c - Doublings*np.log(2)
+        Disc = b**2 - 4*a*c
+        Fix = Grow & (Disc < 0) & (Doublings <= MaxDoublings)     # rounding left the discriminant just below zero
+        Doublings[Fix] += 1
+        c[Fix] -= np.log(2)
+        Disc = b**2 - 4*a*c
+
+        Real = np.where(Quadratic, Disc >= 0, b != 0) & (Doublings <= MaxDoublings) & np.isfinite(c)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Root = np.sqrt(np.where(Real & Quadratic, Disc, 0))
+            Roots = np.where(Quadratic[:,None], np.stack([(-b + Root)/(2*a), (-b - Root)/(2*a)], axis=1), (-c/b)[:,None])
+        Roots = np.where(Real[:,None] & (Roots > 0), Roots, np.inf)
+        G = Roots.min(axis=1)
+
+        Converged = Real
+        G[~np.isfinite(G)] = np.nan                 # intersections exist but none is positive
+        return G, Doublings, Converged
+
+    def _calculate_CDIX(self, G):
+        """
+        Digitize every scan on its own grid and return the number of divisions and CDIX = 2^H per scan.
+        """
+        Scans = len(self.Lengths)
+        NDivs = np.full(Scans, np.nan)
+        CDIX = np.full(Scans, np.nan)
+
+        Valid = np.isfinite(G) & (G > 0) & (self.Lengths > 0)
+        if not Valid.any():
+            return NDivs, CDIX
+
+        Lengths = self.Lengths[Valid]
+        Take = np.repeat(Valid, self.Lengths)
+        D = np.floor(self.MidAmps[Take]/np.repeat(G[Valid], Lengths))
+        Segments = np.concatenate([[0], np.cumsum(Lengths)[:-1]])
+        DMin = np.minimum.reduceat(D, Segments)
+        DMax = np.maximum.reduceat(D, Segments)
+        NDivs[Valid] = DMax - DMin + 1
+
+        # Histogram the divisions of every scan in one bincount over per-scan bin offsets; fall back to np.unique
+        # when the grids are so fine that the bins would vastly outnumber the points
+        Scan = np.repeat(np.arange(len(Lengths)), Lengths)
+        if np.sum(DMax - DMin + 1) <= 4*len(D) + 1024:
+            Bins = (DMax - DMin + 1).astype(np.int64)
+            BinOffsets = np.concatenate([[0], np.cumsum(Bins)[:-1]])
+            Counts = np.bincount(BinOffsets[Scan] + (D - DMin[Scan]).astype(np.int64), minlength=int(Bins.sum()))
+            CountScan = np.repeat(np.arange(len(Lengths)), Bins)
+        else:
+            Keys, Counts = np.unique(np.stack([Scan, D], axis=1), axis=0, return_counts=True)
+            CountScan = Keys[:,0].astype(np.intp)
+
+        P = Counts/Lengths[CountScan]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Terms = np.where(Counts > 0, P*np.log2(P), 0)
+        H = -np.bincount(CountScan, weights=Terms, minlength=len(Lengths))
+        CDIX[Valid] = 2**H
+
+        return NDivs, CDIX
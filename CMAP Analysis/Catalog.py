@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+from MEMReader import MEMRecord
+from ScanCache import DEFAULT_CACHE
+
+CATALOG_PATH = "scans.sqlite"       # SQLite index, relative to the base directory
+ROOTS = ["DMScan", "MEM"]           # Directories indexed by default, relative to the base directory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    path TEXT PRIMARY KEY,          -- MEM file, relative to the base directory
+    folder TEXT, stem TEXT, variant TEXT,
+    mtime REAL, size INTEGER, hash TEXT,
+    name TEXT, subject TEXT, visit INTEGER, centre TEXT, muscle TEXT, sites TEXT,
+    protocol TEXT, date TEXT, age REAL, sex TEXT, temperature REAL, disease TEXT,
+    samples INTEGER, pre1 INTEGER, pre2 INTEGER, post1 INTEGER, post2 INTEGER, units INTEGER
+);
+CREATE INDEX IF NOT EXISTS scans_lookup ON scans (subject, muscle, centre);
+CREATE INDEX IF NOT EXISTS scans_folder ON scans (folder, muscle);
+"""
+
+COLUMNS = ["path", "folder", "stem", "variant", "mtime", "size", "hash",
+           "name", "subject", "visit", "centre", "muscle", "sites",
+           "protocol", "date", "age", "sex", "temperature", "disease",
+           "samples", "pre1", "pre2", "post1", "post2", "units"]
+
+MUSCLES = [("APB", {"APB"}),                    # Normalised muscle and the site tokens that name it
+           ("ADM", {"ADM", "ADQ", "APDM", "AM"}),
+           ("TA", {"TA", "AT", "TIB"})]
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH, base="."):
+        """
+        SQLite index of the MEM files under the base directory.
+        """
+        self.base = base
+        self.connection = sqlite3.connect(os.path.join(base, path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.connection.close()
+
+    def update(self, roots=ROOTS, cache=DEFAULT_CACHE):
+        """Index new and changed MEM files under roots and drop deleted ones; returns (indexed, removed)."""
+        Known = {Row["path"]: Row for Row in self.connection.execute("SELECT path, mtime, size, hash FROM scans")}
+        Seen = set()
+        Indexed = 0
+
+        for Root in roots:
+            for Dir, _, Files in os.walk(os.path.join(self.base, Root)):
+                for File in sorted(Files):
+                    if not File.lower().endswith('.mem'):
+                        continue
+                    Full = os.path.join(Dir, File)
+                    Path = os.path.relpath(Full, self.base).replace(os.sep, "/")
+                    Seen.add(Path)
+                    Stat = os.stat(Full)
+                    Row = Known.get(Path)
+                    if Row is not None and Row["mtime"] == Stat.st_mtime and Row["size"] == Stat.st_size:
+                        continue
+
+                    with open(Full, 'rb') as file:
+                        Hash = hashlib.sha1(file.read()).hexdigest()
+                    if Row is not None and Row["hash"] == Hash:
+                        self.connection.execute("UPDATE scans SET mtime = ?, size = ? WHERE path = ?", (Stat.st_mtime, Stat.st_size, Path))
+                        continue
+
+                    try:
+                        Record = cache.load(Full) if cache is not None else MEMRecord(Full)
+                    except (OSError, ValueError):
+                        continue
+                    self.connection.execute(f"INSERT OR REPLACE INTO scans VALUES ({', '.join('?'*len(COLUMNS))})",
+                                            self._describe(Path, Stat, Hash, Record))
+                    Indexed += 1
+
+        Removed = [Path for Path in Known if Path not in Seen and Path.startswith(tuple(Root.rstrip("/") + "/" for Root in roots))]
+        self.connection.executemany("DELETE FROM scans WHERE path = ?", [(Path,) for Path in Removed])
+        self.connection.commit()
+        return Indexed, len(Removed)
+
+    def scans(self, **filters):
+        """Return the indexed scans whose columns equal the given values, ordered by subject, date and stem."""
+        Where = " AND ".join(f"{Column} = ?" for Column in filters if Column in COLUMNS)
+        Query = "SELECT * FROM scans" + (f" WHERE {Where}" if Where else "") + " ORDER BY subject, date, stem"
+        return [dict(Row) for Row in self.connection.execute(Query, [filters[Column] for Column in filters if Column in COLUMNS])]
+
+    def pairs(self, folder=None, muscle=None, centre=None, variant=None):
+        """Return (subject, V1 scan, V2 scan) for every subject with both visits of one muscle and variant."""
+        Filters = {Column: Value for Column, Value in (("folder", folder), ("muscle", muscle), ("centre", centre), ("variant", variant)) if Value is not None}
+
+        Groups = {}
+        for Scan in self.scans(**Filters):
+            Groups.setdefault((Scan["centre"], Scan["subject"], Scan["muscle"], Scan["variant"], Scan["folder"]), []).append(Scan)
+
+        Pairs = []
+        for Key in sorted(Groups, key=lambda Key: (Key[0] or "", self._natural(Key[1]), Key[2] or "", Key[3], Key[4])):
+            Visits = {}
+            for Rank, Scan in enumerate(Groups[Key], start=1):
+                Visits.setdefault(Scan["visit"] if Scan["visit"] is not None else Rank, Scan)  # unnumbered names are ordered by date
+            if 1 in Visits and 2 in Visits:
+                Pairs.append((Key[1], Visits[1], Visits[2]))
+        return Pairs
+
+    def write_mef(self, prefix, pairs):
+        """Write prefix-1.MEF and prefix-2.MEF with the V1 and V2 scan stems of each pair on matching lines."""
+        for Visit in (1, 2):
+            with open(f"{prefix}-{Visit}.MEF", 'w') as fp:
+                for Pair in pairs:
+                    fp.write("%s\n" % Pair[Visit]["stem"])
+
+    def _describe(self, Path, Stat, Hash, Record):
+        """Return the row of one scan."""
+        Folder, File = Path.rsplit("/", 1)
+        Stem = File[:-4]
+        Name = Record.name or ""
+        Subject, Visit = self._subject(Name)
+        Scanpts = (Record.scanpts[0] if Record.scanpts and Record.scanpts[0] else []) + [None]*4
+        return (Path, Folder, Stem, Stem.rsplit("_", 1)[1] if "_" in Stem else "",
+                Stat.st_mtime, Stat.st_size, Hash,
+                Name, Subject, Visit, self._centre(Name, Folder), self._muscle(Record.sites), Record.sites,
+                Record.protocol, self._date(Record.date), Record.age, Record.sex, Record.temperature, Record.header.get("NC/disease"),
+                len(Record.blocks[0][0]) if Record.blocks else 0, *Scanpts[:4], len(Record.model))
+
+    def _subject(self, Name):
+        """Split multicentre names like CA.EDM.NC.1.2 into subject CA.EDM.NC.1 and visit 2."""
+        Parts = Name.split(".")
+        if len(Parts) >= 3 and Parts[-1].isdigit():
+            return ".".join(Parts[:-1]), int(Parts[-1])
+        return Name, None
+
+    def _centre(self, Name, Folder):
+        """Return the centre code (ie: DK-AAR) from the name, else the folder below the indexed root."""
+        Parts = [Part.upper() for Part in Name.split(".") if Part.isalpha() and Part.upper() not in ("NC", "HC")]
+        if len(Parts) >= 2 and len(Parts[0]) == 2 and "." in Name:
+            return f"{Parts[0]}-{Parts[1]}"
+        Dirs = Folder.split("/")
+        return re.sub(r"\s+\d+$", "", Dirs[1] if len(Dirs) > 1 else Dirs[0])
+
+    def _muscle(self, Sites):
+        """Normalise the S/R sites field (ie: Median Wr-APB, RUln Wr-ADQ, Peroneal-TA) to APB, ADM or TA."""
+        Tokens = set(re.findall(r"[A-Z]+", (Sites or "").upper()))
+        for Muscle, Names in MUSCLES:
+            if Tokens & Names:
+                return Muscle
+        return Sites
+
+    def _date(self, Date):
+        """Return the d/m/y header date in ISO form, so dates sort chronologically."""
+        try:
+            return datetime.strptime(Date, "%d/%m/%y").date().isoformat()
+        except (TypeError, ValueError):
+            return Date
+
+    def _natural(self, Text):
+        return [int(Part) if Part.isdigit() else Part for Part in re.split(r"(\d+)", Text or "")]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index MEM files and generate MEF files from the index.")
+    parser.add_argument("command", choices=["update", "mef"], help="update: index new and changed scans; mef: write paired MEF files")
+    parser.add_argument("--roots", nargs="+", default=ROOTS, help="directories to index")
+    parser.add_argument("--folder", help="only scans in this folder (ie: 'DMScan/Multicentre 146')")
+    parser.add_argument("--muscle", help="APB, ADM or TA")
+    parser.add_argument("--centre", help="centre code (ie: DK-AAR)")
+    parser.add_argument("--variant", help="file name suffix after the last underscore (ie: OM2, A3)")
+    parser.add_argument("--prefix", default="Catalog", help="MEF files are written as <prefix>-1.MEF and <prefix>-2.MEF")
+    args = parser.parse_args()
+
+    with Catalog() as catalog:
+        if args.command == "update":
+            Indexed, Removed = catalog.update(args.roots)
+            print(f"Indexed {Indexed} scans, removed {Removed}", file=sys.stderr)
+        else:
+            Pairs = catalog.pairs(args.folder, args.muscle, args.centre, args.variant)
+            catalog.write_mef(args.prefix, Pairs)
+            print(f"Wrote {len(Pairs)} pairs to {args.prefix}-1.MEF and {args.prefix}-2.MEF", file=sys.stderr)
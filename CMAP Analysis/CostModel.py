@@ -0,0 +1,79 @@
+import os
+import json
+import numpy as np
+
+# Prior log-cost weights per method over [1, log samples, log(1 + amplitude range), log(1 + steps), log grid size],
+# roughly matching measured runtimes; observed runtimes pull the weights away from the prior
+PRIORS = {'CDIX': [-11.5, 1.0, 0.0, 0.3, 0.3],
+          'STEPIX': [-13.0, 1.0, 0.0, 0.3, 0.1],
+          'Stairfit': [-15.5, 2.0, 0.0, 0.3, 0.1]}
+DEFAULT_PRIOR = [-12.0, 1.0, 0.0, 0.3, 0.3]
+
+class CostModel:
+    def __init__(self, path=None, history=5000, ridge=1.0):
+        """
+        Log-linear runtime predictor per method from cheap scan features, refined by observed runtimes.
+        Observations persist as JSON at path, keeping the latest history per method.
+        """
+        self.path = path
+        self.history = history
+        self.ridge = ridge
+        self.observations = {}      # method -> list of (features, seconds)
+        self.weights = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as file:
+                Saved = json.load(file)
+            self.observations = {Method: [(np.array(x), s) for x, s in Rows] for Method, Rows in Saved.items()}
+        self.fit()
+
+    @staticmethod
+    def features(Amps, GridSize):
+        """Return the feature vector of a scan: sample count, amplitude range and number of distinct steps."""
+        return CostModel.with_grid(CostModel.scan_features(Amps), GridSize)
+
+    @staticmethod
+    def scan_features(Amps):
+        """Return the features of a scan that do not depend on the grid; an unread scan ([]) has none."""
+        Amps = np.asarray(Amps, dtype=float)
+        if len(Amps) == 0:
+            return np.array([1, 0, 0, 0])
+        Steps = np.count_nonzero(np.diff(np.sort(Amps)))
+        return np.array([1, np.log(len(Amps)), np.log1p(np.ptp(Amps)), np.log1p(Steps)])
+
+    @staticmethod
+    def with_grid(ScanFeatures, GridSize):
+        """Return the feature vector of a task from the features of its scan and the size of its grid."""
+        return np.append(ScanFeatures, np.log(max(GridSize, 1)))
+
+    def predict(self, Method, Features):
+        """Return the predicted seconds for one feature vector, or for a (tasks x features) array."""
+        Weights = self.weights.get(Method, np.array(PRIORS.get(Method, DEFAULT_PRIOR)))
+        return np.exp(np.clip(np.asarray(Features) @ Weights, -50, 50))
+
+    def observe(self, Method, Features, Seconds):
+        Rows = self.observations.setdefault(Method, [])
+        Rows.append((np.asarray(Features, dtype=float), float(Seconds)))
+        del Rows[:-self.history]
+
+    def fit(self):
+        """Ridge regression of log runtime on the features, shrunk towards the method prior."""
+        for Method, Rows in self.observations.items():
+            Prior = np.array(PRIORS.get(Method, DEFAULT_PRIOR))
+            if not Rows:
+                continue
+            X = np.array([x for x, _ in Rows])
+            y = np.log(np.maximum([s for _, s in Rows], 1e-6))
+            A = X.T @ X + self.ridge*np.eye(len(Prior))
+            self.weights[Method] = np.linalg.solve(A, X.T @ y + self.ridge*Prior)
+
+    def save(self):
+        if self.path is None:
+            return
+        Directory = os.path.dirname(self.path)
+        if Directory:
+            os.makedirs(Directory, exist_ok=True)
+        Temp = self.path + ".tmp"
+        with open(Temp, 'w') as file:
+            json.dump({Method: [(list(x), s) for x, s in Rows] for Method, Rows in self.observations.items()}, file)
+        os.replace(Temp, self.path)
@@ -1,21 +1,28 @@
 import pandas as pd
 import numpy as np
+from MEMReader import MEMRecord
+from ScanCache import DEFAULT_CACHE
 
 class DataHandler:
-    def __init__(self, filename):
-        """Initialize the data handler and load x and y from the given file."""
+    def __init__(self, filename, cache=DEFAULT_CACHE):
+        """Initialize the data handler and load x and y from the given file; MEM files go through the parse cache unless cache is None."""
+        self.cache = cache
         filetype = self._check_file_type(filename)
 
         if filetype == 'MEM':
-            self.x, self.y, self.prescan_indices, self.postscan_indices = self._read_mem(filename)
+            self.record = self._read_mem(filename)
+            self.x, self.y = self.record.x, self.record.y
+            self.prescan_indices, self.postscan_indices = self.record.prescan_indices, self.record.postscan_indices
+            self.name = self.record.name
         else:
+            self.record = None
             self.x, self.y = self._read_csv(filename)
+            self.prescan_indices, self.postscan_indices = [0, 0], [len(self.x), len(self.x)]
+            self.name = None
         
         self.x_trimmed = self.x[self.prescan_indices[1]:self.postscan_indices[0]]
         self.y_trimmed = self.y[self.prescan_indices[1]:self.postscan_indices[0]]
 
-        self.name = self._find_name(filename)
-
     def _check_file_type(self, filename):
         """Return the file type based on the extension."""
         if filename.lower().endswith('.mem'):
@@ -33,43 +40,8 @@ class DataHandler:
         return stims, amps
 
     def _read_mem(self, filename):
-        """Read data from MEM file and return Stims and Amps."""
-        lines = self._read_file_lines(filename)
-
-        ms_indices = [i for i, line in enumerate(lines) if "MS." in line]
-        
-        if not ms_indices:
-            return [], []
-        
-        scanpts_index=ms_indices[0]-2
-
-        scanpts=lines[scanpts_index].split()
-        prescan_indices=[int(scanpts[1][:-1]), int(scanpts[2][:-1])]
-        postscan_indices=[int(scanpts[3][:-1]), int(scanpts[4])]
-        
-
-        stims, amps = [], []
-        for i in ms_indices:
-            parts = lines[i].split()
-            stims.append(float(parts[1]))
-            amps.append(float(parts[2]))
-
-        return np.array(stims), np.array(amps), prescan_indices, postscan_indices
-
-    def _find_name(self, filename):
-        lines = self._read_file_lines(filename)
-        MSindices = [i for i, line in enumerate(lines) if "Name:" in line]
-        if len(MSindices)==0:
-            return None
-        MSlines=[lines[i] for i in MSindices]
-        for line in MSlines:
-            index1=line.find("\t")
-            NameString=line[index1+1:-1]
-        if NameString[0]==" ":
-            NameString=NameString[1:]
-        return NameString
-
-    def _read_file_lines(self, filename):
-        """Read the lines of a file and return them as a list."""
-        with open(filename, 'rt', encoding='utf-8', errors='replace') as file:
-            return file.readlines()
\ No newline at end of file
+        """Parse the MEM file in one pass, including header, repeat blocks and MScanFit results."""
+        record = self.cache.load(filename) if self.cache is not None else MEMRecord(filename)
+        if not record.blocks:
+            raise ValueError(f"No M-SCAN data in {filename}.")
+        return record
@@ -1,41 +1,23 @@
-from DataHandler import DataHandler
 import os
+import sys
 
-filelist = [f for f in os.listdir() if f.endswith('.MEM')]
-#print(filelist)
+Base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")    # CMAP Analysis, where the catalog lives
+sys.path.insert(0, Base)
+from Catalog import Catalog
 
+with Catalog(base=Base) as catalog:
+    catalog.update(["MEM/Beth"])
+    Pairs = catalog.pairs(folder="MEM/Beth")
 
-Diction={}
-
-for file in filelist:
-    Data=DataHandler(file)
-    if Data.name in Diction:
-        Diction[Data.name].append(file)
-    else:
-        Diction[Data.name] = [file]
-
-Diction = {k: Diction[k] for k in sorted(Diction.keys())}
-
-print(len(Diction))
-print(Diction)
-
-filenames=[]
-for i in Diction:
-    filenames.extend(Diction[i])
-
-
-print(filenames)
-
-V1=filenames[::2]
-V2=filenames[1::2]
+print(len(Pairs))
+print([Subject for Subject, V1, V2 in Pairs])
 
 with open('Beth.MEF', 'w') as fp:
-    for item in V1:
-        # write each item on a new line
-        fp.write("%s\n" % item[:-4])
-    for item in V2:
+    for Subject, V1, V2 in Pairs:
         # write each item on a new line
-        fp.write("%s\n" % item[:-4])
+        fp.write("%s\n" % V1["stem"])
+    for Subject, V1, V2 in Pairs:
+        fp.write("%s\n" % V2["stem"])
     print('Done')
 
 ## Code below useful in RunAnalysis for finding and sorting names
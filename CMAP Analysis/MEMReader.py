@@ -0,0 +1,142 @@
+import re
+import numpy as np
+
+PARSER_VERSION = 1      # Bump whenever the parsed record changes, so cached records are rebuilt
+LABEL = re.compile(r"MS\.\S*")  # Row label in front of every stimulus, amplitude pair
+
+class MEMRecord:
+    def __init__(self, filename=None):
+        """
+        Parse a Qtrac MEM file in a single streaming pass.
+        """
+        self.filename = filename
+        self.header = {}                    # "Key: value" fields before the first M-SCAN block
+        self.scanpts = []                   # [pre1, pre2, post1, post2] per repeat block
+        self.blocks = []                    # (Stims, Amps) arrays per repeat block
+        self.results = {}                   # "Key = value" derived and extra variables (MSc*, MSF*, ...)
+        self.model = np.empty((0, 4))       # MScanFit model table, one row per unit
+
+        if filename is not None:
+            self._parse(filename)
+
+    @property
+    def name(self):
+        return self.header.get("Name")
+
+    @property
+    def protocol(self):
+        return self.header.get("Protocol")
+
+    @property
+    def date(self):
+        return self.header.get("Date")
+
+    @property
+    def age(self):
+        return self._number(self.header.get("Age"))
+
+    @property
+    def sex(self):
+        return self.header.get("Sex")
+
+    @property
+    def temperature(self):
+        return self._number(self.header.get("Temperature"))
+
+    @property
+    def sites(self):
+        return self.header.get("S/R sites")
+
+    @property
+    def x(self):
+        """Stimuli of the first repeat block."""
+        return self.blocks[0][0]
+
+    @property
+    def y(self):
+        """Amplitudes of the first repeat block."""
+        return self.blocks[0][1]
+
+    @property
+    def prescan_indices(self):
+        return self.scanpts[0][:2]
+
+    @property
+    def postscan_indices(self):
+        return self.scanpts[0][2:]
+
+    def _parse(self, filename):
+        """Read the header, every repeat block, the extra variables and the MScanFit model."""
+        InHeader = True         # header fields end at the first M-SCAN block
+        Scanpts = None          # Scanpts of the block about to be read
+        Rows = None             # MS. rows of the block being read
+        ModelRows = None        # rows of the MScanFit model table being read
+        ModelCount = None
+
+        with open(filename, 'rt', encoding='utf-8', errors='replace') as file:
+            for line in file:
+                line = line.strip()
+
+                if line.startswith("MS."):
+                    if Rows is None:
+                        Rows = []
+                    Rows.append(line)
+                    continue
+
+                if Rows is not None:
+                    self._add_block(Rows, Scanpts)
+                    Rows = None
+
+                if ModelRows is not None:
+                    if ModelCount is None:
+                        ModelCount = int(line[1:])
+                    elif line:
+                        ModelRows.append(line)
+                    if len(ModelRows) >= ModelCount:
+                        self.model = self._convert_model(ModelRows)
+                        ModelRows = None
+                elif line.startswith("Scanpts:"):
+                    Scanpts = [int(i) for i in line.split(":", 1)[1].split(",")]
+                    InHeader = False
+                elif line.startswith("M-SCAN DATA"):
+                    InHeader = False
+                elif line.startswith("!MScan Model"):
+                    ModelRows = []
+                elif " = " in line:
+                    Key, _, Value = line.partition(" = ")
+                    self.results[Key.strip()] = self._number(Value.strip(), Value.strip())
+                elif InHeader and ":" in line:
+                    Key, _, Value = line.partition(":")
+                    self.header.setdefault(Key.strip(), Value.strip())
+
+        if Rows is not None:
+            self._add_block(Rows, Scanpts)
+        if ModelRows:
+            self.model = self._convert_model(ModelRows)
+
+    def _add_block(self, Rows, Scanpts):
+        """Store a finished repeat block; a block without its own Scanpts line reuses the previous one."""
+        if Scanpts is None and self.scanpts:
+            Scanpts = self.scanpts[-1]
+        self.scanpts.append(Scanpts)
+        self.blocks.append(self._convert_block(Rows))
+
+    def _convert_block(self, Rows):
+        """Convert the text of all MS. rows of a block to Stims and Amps arrays in one call."""
+        Values = np.fromstring(LABEL.sub(" ", " ".join(Rows)), sep=" ")
+        if len(Values) == 2*len(Rows):
+            Data = Values.reshape(-1, 2)
+        else:
+            Data = np.array([Row.split()[1:3] for Row in Rows], dtype=float)
+        return Data[:, 0].copy(), Data[:, 1].copy()
+
+    def _convert_model(self, ModelRows):
+        """Convert the MScanFit model rows to a (units x columns) array."""
+        Values = " ".join(ModelRows).split()
+        return np.array(Values, dtype=float).reshape(len(ModelRows), -1)
+
+    def _number(self, Value, default=None):
+        try:
+            return float(Value)
+        except (TypeError, ValueError):
+            return default
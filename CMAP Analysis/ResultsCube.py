@@ -0,0 +1,220 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+AXES = ["subject", "visit", "muscle", "method", "parameter", "output"]
+
+class ResultsCube:
+    def __init__(self, directory):
+        """
+        Labeled (subject x visit x muscle x method x parameter x output) array of analysis results on disk.
+        Values are float64 in a raw C-ordered file with the subject axis outermost, so new subjects are appended to
+        the end of the file and other cells are written in place; labels, the string values of categorical outputs
+        (ie: Point) and the scan name and filename of every subject, visit and muscle live in a JSON sidecar.
+        """
+        self.directory = directory
+        self.labels = {Axis: [] for Axis in AXES}
+        self.categories = {}        # output -> string values, stored as their index
+        self.scans = {}             # (subject, visit, muscle) -> (name, filename)
+
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path(), 'r') as file:
+                Meta = json.load(file)
+            self.labels = {Axis: Meta["axes"][Axis] for Axis in AXES}
+            self.categories = Meta["categories"]
+            self.scans = {(Subject, Visit, Muscle): (Name, Filename) for Subject, Visit, Muscle, Name, Filename in Meta["scans"]}
+        self._index = {Axis: {Label: i for i, Label in enumerate(Labels)} for Axis, Labels in self.labels.items()}
+
+    @property
+    def shape(self):
+        return tuple(len(self.labels[Axis]) for Axis in AXES)
+
+    def put(self, Subject, Visit, Muscle, Method, Results, Name=None, Filename=None):
+        """Store the {parameter: {output: value}} results of one scan and method."""
+        self.put_many([(Subject, Visit, Muscle, Method, Results, Name, Filename)])
+
+    def put_many(self, Records):
+        """
+        Store many (subject, visit, muscle, method, results, name, filename) records at once.
+        Each record replaces everything stored for its scan and method, so empty results (ie: a failed task) clear it.
+        Unseen subjects are appended; an unseen label on another axis rewrites the file once for the whole batch.
+        """
+        Slices = []
+        Cells = []
+        for Subject, Visit, Muscle, Method, Results, Name, Filename in Records:
+            Key = (str(Subject), int(Visit), str(Muscle))
+            if Name is not None or Filename is not None:
+                self.scans[Key] = (Name, Filename)
+            Slices.append((*Key, str(Method)))
+            for Parameter, Outputs in Results.items():
+                for Output, Value in Outputs.items():
+                    Cells.append((*Key, str(Method), float(Parameter), str(Output), self._encode(Output, Value)))
+
+        Old = self.shape
+        for Cell in Cells:
+            for Axis, Label in zip(AXES, Cell[:-1]):
+                if Label not in self._index[Axis]:
+                    self._index[Axis][Label] = len(self.labels[Axis])
+                    self.labels[Axis].append(Label)
+        self._resize(Old)
+        self._write_meta()
+
+        Data = self._memmap('r+')
+        if Data is None:
+            return
+        for Slice in Slices:
+            if all(Label in self._index[Axis] for Axis, Label in zip(AXES, Slice)):
+                Data[tuple(self._index[Axis][Label] for Axis, Label in zip(AXES, Slice))] = np.nan
+        if Cells:
+            Index = np.array([[self._index[Axis][Label] for Axis, Label in zip(AXES, Cell[:-1])] for Cell in Cells])
+            Data[tuple(Index.T)] = [Cell[-1] for Cell in Cells]
+        Data.flush()
+
+    def clear(self):
+        """Drop every stored value and label, leaving an empty cube."""
+        for Path in (self._data_path(), self._meta_path()):
+            if os.path.exists(Path):
+                os.remove(Path)
+        self.labels = {Axis: [] for Axis in AXES}
+        self.categories = {}
+        self.scans = {}
+        self._index = {Axis: {} for Axis in AXES}
+
+    def select(self, **Selection):
+        """
+        Return the values and remaining axis labels of a slice, ie: select(method='STEPIX', muscle='APB', visit=[1,2]).
+        Each axis takes a label, a list of labels or None for all; a single label drops its axis.
+        """
+        Unknown = set(Selection) - set(AXES)
+        if Unknown:
+            raise KeyError(f"Unknown axes {sorted(Unknown)}")
+
+        Indices = []
+        Labels = {}
+        Squeeze = []
+        for Axis in AXES:
+            Wanted = Selection.get(Axis)
+            if Wanted is None:
+                Indices.append(np.arange(len(self.labels[Axis])))
+                Labels[Axis] = list(self.labels[Axis])
+            elif isinstance(Wanted, (list, tuple, np.ndarray)):
+                Indices.append(np.array([self._lookup(Axis, Label) for Label in Wanted], dtype=np.intp))
+                Labels[Axis] = list(Wanted)
+            else:
+                Indices.append(np.array([self._lookup(Axis, Wanted)], dtype=np.intp))
+                Squeeze.append(AXES.index(Axis))
+
+        Data = self._memmap('r')
+        if Data is None:
+            Values = np.full([len(Index) for Index in Indices], np.nan)
+        else:
+            Values = Data[np.ix_(*Indices)]
+        return Values.squeeze(axis=tuple(Squeeze)), Labels
+
+    def frame(self, **Selection):
+        """Return a slice as a long DataFrame with one row per stored value, categorical outputs decoded."""
+        Values, Labels = self.select(**Selection)
+        Fixed = {Axis: Selection[Axis] for Axis in AXES if Axis not in Labels}
+        Axes = [Axis for Axis in AXES if Axis in Labels]
+        Index = np.nonzero(~np.isnan(Values))
+        Rows = pd.DataFrame({Axis: np.asarray(Labels[Axis], dtype=object)[Index[i]] for i, Axis in enumerate(Axes)})
+        for Axis, Label in Fixed.items():
+            Rows[Axis] = Label
+        Rows["value"] = Values[Index]
+        Rows = Rows[AXES + ["value"]]
+        Rows["value"] = [self.decode(Output, Value) for Output, Value in zip(Rows["output"], Rows["value"])]
+        return Rows
+
+    def decode(self, Output, Value):
+        """Return the string of a categorical output code, or the value itself for numeric outputs."""
+        if Output in self.categories and not np.isnan(Value):
+            return self.categories[Output][int(Value)]
+        return Value
+
+    def to_excel(self, directory):
+        """
+        Export to the workbooks of the RunAnalysis scripts: {directory}/{Method}/{Muscle}V{Visit}.xlsx with one sheet per
+        scan, thresholds as columns and outputs as rows, followed by the Filename column.
+        """
+        Data = self._memmap('r')
+        if Data is None:
+            return
+        Stored = ~np.isnan(Data)
+        for m, Method in enumerate(self.labels["method"]):
+            for u, Muscle in enumerate(self.labels["muscle"]):
+                for v, Visit in enumerate(self.labels["visit"]):
+                    Cells = Stored[:, v, u, m]
+                    Subjects = np.flatnonzero(Cells.any(axis=(1,2)))
+                    if len(Subjects) == 0:
+                        continue
+                    Parameters = sorted(np.flatnonzero(Cells.any(axis=(0,2))), key=lambda p: self.labels["parameter"][p])
+                    Outputs = np.flatnonzero(Cells.any(axis=(0,1)))
+                    os.makedirs(os.path.join(directory, Method), exist_ok=True)
+                    with pd.ExcelWriter(os.path.join(directory, Method, f'{Muscle}V{Visit}.xlsx')) as ExcelWriter:
+                        for s in Subjects:
+                            Subject = self.labels["subject"][s]
+                            Name, Filename = self.scans.get((Subject, Visit, Muscle), (Subject, Subject))
+                            Values = Data[s, v, u, m][np.ix_(Parameters, Outputs)]
+                            ThreshDict = {self.labels["parameter"][p]: {self.labels["output"][o]: self.decode(self.labels["output"][o], Values[i, j]) for j, o in enumerate(Outputs)} for i, p in enumerate(Parameters)}
+                            ThreshDict['Filename'] = Filename
+                            df = pd.DataFrame(ThreshDict)
+                            df.to_excel(ExcelWriter, sheet_name=str(Name)[:31])
+
+    def _lookup(self, Axis, Label):
+        Key = float(Label) if Axis == "parameter" else int(Label) if Axis == "visit" else Label
+        if Key not in self._index[Axis]:
+            raise KeyError(f"No {Axis} {Label!r} in {self.directory}")
+        return self._index[Axis][Key]
+
+    def _encode(self, Output, Value):
+        if isinstance(Value, str):
+            Codes = self.categories.setdefault(str(Output), [])
+            if Value not in Codes:
+                Codes.append(Value)
+            return float(Codes.index(Value))
+        try:
+            return float(Value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def _resize(self, Old):
+        """Grow the file from shape Old to the current labels: append subjects, or rewrite when an inner axis grew."""
+        New = self.shape
+        os.makedirs(self.directory, exist_ok=True)
+        if New == Old:
+            return
+        Inner = int(np.prod(New[1:]))
+        if Old[1:] == New[1:] and os.path.exists(self._data_path()):
+            with open(self._data_path(), 'r+b') as file:
+                file.seek(Old[0]*Inner*8)       # drop anything past the recorded shape, ie: from an interrupted append
+                file.truncate()
+                np.full((New[0]-Old[0])*Inner, np.nan).tofile(file)
+            return
+
+        Values = np.full(New, np.nan)
+        if all(Old):
+            Values[tuple(slice(0, n) for n in Old)] = np.fromfile(self._data_path(), count=int(np.prod(Old))).reshape(Old)
+        Temp = self._data_path() + ".tmp"
+        Values.tofile(Temp)
+        os.replace(Temp, self._data_path())
+
+    def _memmap(self, mode):
+        if not all(self.shape) or not os.path.exists(self._data_path()):
+            return None
+        return np.memmap(self._data_path(), dtype=np.float64, mode=mode, shape=self.shape)
+
+    def _write_meta(self):
+        os.makedirs(self.directory, exist_ok=True)
+        Meta = {"axes": self.labels, "categories": self.categories,
+                "scans": [[*Key, Name, Filename] for Key, (Name, Filename) in self.scans.items()]}
+        Temp = self._meta_path() + ".tmp"
+        with open(Temp, 'w') as file:
+            json.dump(Meta, file)
+        os.replace(Temp, self._meta_path())
+
+    def _data_path(self):
+        return os.path.join(self.directory, "data.f8")
+
+    def _meta_path(self):
+        return os.path.join(self.directory, "axes.json")
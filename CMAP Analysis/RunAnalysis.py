@@ -0,0 +1,211 @@
+import os
+import re
+import sys
+import csv
+import time
+import queue
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from DataHandler import DataHandler
+from CostModel import CostModel
+from ResultsCube import ResultsCube
+
+# Default parameter grid per method, as used for the multicentre analysis
+GRIDS = {'CDIX': np.linspace(0.25,5,20),           # Mean_LS
+         'STEPIX': np.linspace(0.0025,0.05,20),    # NoiseThreshold
+         'Stairfit': np.linspace(0.010,0.020,3)}   # termination_threshold, typical (0.005,0.025,5) but not working for TA
+
+FIELDS = ['Condition', 'Filename', 'Name', 'Method', 'Parameter', 'Measure', 'Value']
+
+def read_file_lines(filename):
+    """Read the lines of a file and return them as a list."""
+    with open(filename, 'rt') as file:
+        return file.read().splitlines()
+
+def mef_conditions(mefs):
+    """Return {condition: [(stem, path)]} for MEF files given as PATH or NAME=PATH; scans sit next to their MEF."""
+    Conditions = {}
+    for Mef in mefs:
+        Name, _, Path = Mef.rpartition('=')
+        Name = Name or os.path.splitext(os.path.basename(Path))[0]
+        Dir = os.path.dirname(Path)
+        Conditions[Name] = [(Stem, os.path.join(Dir, f'{Stem}.MEM')) for Stem in read_file_lines(Path) if Stem.strip()]
+    return Conditions
+
+def catalog_conditions(folder=None, muscle=None, centre=None, variant=None):
+    """Return {condition: [(stem, path)]} of the paired V1/V2 scans of a catalog query, per muscle (ie: APBV1, APBV2)."""
+    from Catalog import Catalog
+    Conditions = {}
+    with Catalog() as catalog:
+        catalog.update()
+        for Subject, V1, V2 in catalog.pairs(folder, muscle, centre, variant):
+            for Visit, Scan in (('V1', V1), ('V2', V2)):
+                Conditions.setdefault(f"{Scan['muscle']}{Visit}", []).append((Scan['stem'], Scan['path']))
+    return dict(sorted(Conditions.items()))
+
+def split_condition(Cond):
+    """Return the (muscle, visit) of a condition name (ie: APBV2 -> APB, 2); names without a visit are visit 1."""
+    Match = re.fullmatch(r'(.+?)V(\d+)', Cond)
+    return (Match.group(1), int(Match.group(2))) if Match else (Cond, 1)
+
+def subject_name(Name, Visit):
+    """Return the subject of a scan name, dropping a trailing visit number (ie: CA.EDM.NC.1.2 -> CA.EDM.NC.1)."""
+    return Name[:-len(f'.{Visit}')] if Name.endswith(f'.{Visit}') else Name
+
+def stored_subject(cube, Stem, Visit, Muscle):
+    """Return the subject a cube holds the scan file Stem under, for a scan that could not be read this time."""
+    for (Subject, V, U), (_, Filename) in cube.scans.items():
+        if (V, U, Filename) == (Visit, Muscle, Stem):
+            return Subject
+    return subject_name(Stem, Visit)
+
+def build_tasks(conditions, methods, grids):
+    """Flatten conditions x scans x methods into tasks; each task evaluates the whole parameter grid of its method."""
+    return [(Cond, Stem, Path, Method, grids[Method]) for Method in methods for Cond in conditions for Stem, Path in conditions[Cond]]
+
+def run_task(task):
+    """
+    Analyse one scan with one method over its grid and return (task, name, {parameter: {measure: value}}, seconds,
+    scan features), the scan's cost features being computed here from the amplitudes already read.
+    """
+    Cond, Stem, Path, Method, Grid = task
+    Start = time.perf_counter()
+    Name = None
+    Results = {}
+    Scan = CostModel.scan_features([])
+    try:
+        Data = DataHandler(Path)
+        Name = Data.name
+        Scan = CostModel.scan_features(Data.y)
+        if Method == 'CDIX':
+            from CDIX import CDIX
+            G, NDivs, CDIXs = CDIX(Data.x,Data.y).sweep(Grid)
+            Results = {p: {'Gridsize':G[i], 'NDivs':NDivs[i], 'CDIX':CDIXs[i]} for i, p in enumerate(Grid)}
+        elif Method == 'STEPIX':
+            from STEPIX import SETPIX
+            Values = SETPIX(Data.y_trimmed, NoiseThreshold=Grid)
+            Results = {p: {'STEPIX':Values.STEPIX[i], 'AMPIX':Values.AMPIX[i], 'D50':Values.D50[i], 'Point':Values.Point[i]} for i, p in enumerate(Grid)}
+        elif Method == 'Stairfit':
+            from Stairfit import Stairfit
+            Values = Stairfit(Data.x, Data.y, termination_threshold=Grid)
+            Results = {p: {'MUNE':Values.M[i], 'Diff':Values.Diff[i]} for i, p in enumerate(Grid)}
+        else:
+            raise ValueError(f"Unknown method '{Method}'")
+    except Exception as Error:
+        print(f"\n{Method} failed on {Stem}: {Error}", file=sys.stderr)
+    return task, Name, Results, time.perf_counter() - Start, Scan
+
+def run(tasks, out, processes=None, callback=None, model=None, refit=16, cube=None):
+    """
+    Execute tasks on a process pool, writing one CSV row per (scan, method, parameter, measure) to out (replaced at the
+    start of the run) and storing the results in cube (a ResultsCube) as each task completes; callback(task, name,
+    results, seconds) runs in this process after each task is written.
+
+    Tasks are dispatched one at a time, longest predicted first, keeping only one task per worker in flight; every
+    refit completions the cost model is refitted on the observed runtimes and the remaining tasks are re-ranked.
+    Scans are only read by the workers: tasks are first ranked by method and grid size alone, and the features a
+    worker returns with a scan's first result rank that scan's tasks for the other methods from the next refit.
+    """
+    Model = model if model is not None else CostModel()
+    Directory = os.path.dirname(out)
+    if Directory:
+        os.makedirs(Directory, exist_ok=True)
+
+    Scans = {}              # path -> features of the scans read so far
+    Unread = CostModel.scan_features([])
+    Pending = list(range(len(tasks)))
+
+    def rank():
+        Predicted = {i: Model.predict(tasks[i][3], CostModel.with_grid(Scans.get(tasks[i][2], Unread), len(tasks[i][4]))) for i in Pending}
+        Pending.sort(key=lambda i: Predicted[i])        # longest expected last, so pop() takes it first
+
+    with open(out, 'w', newline='') as file, Pool(processes) as pool:
+        Writer = csv.writer(file)
+        Writer.writerow(FIELDS)
+        Slots = processes or os.cpu_count() or 1
+        Finished = queue.Queue()
+        InFlight = 0
+        rank()
+        Start = time.perf_counter()
+        Done = 0
+        while Pending or InFlight:
+            while Pending and InFlight < Slots:
+                i = Pending.pop()
+                pool.apply_async(run_task, (tasks[i],), callback=lambda Result, i=i: Finished.put((i, Result)), error_callback=lambda Error: Finished.put((None, Error)))
+                InFlight += 1
+
+            i, Result = Finished.get()
+            InFlight -= 1
+            if i is None:
+                raise Result
+            Task, Name, Results, Seconds, Scan = Result
+            Done += 1
+
+            Cond, Stem, _, Method, _ = Task
+            for Parameter, Measures in Results.items():
+                for Measure, Value in Measures.items():
+                    Writer.writerow([Cond, Stem, Name, Method, Parameter, Measure, Value])
+            file.flush()        # results are on disk as soon as their task completes
+            if cube is not None:
+                Muscle, Visit = split_condition(Cond)
+                if Results:
+                    cube.put(subject_name(Name, Visit), Visit, Muscle, Method, Results, Name, Stem)
+                else:           # a failed task clears what an earlier run stored for its scan
+                    cube.put(stored_subject(cube, Stem, Visit, Muscle), Visit, Muscle, Method, {})
+
+            if Results:         # a failed task's runtime says nothing about its cost
+                Scans[Task[2]] = Scan
+                Model.observe(Method, CostModel.with_grid(Scan, len(Task[4])), Seconds)
+            if Done % refit == 0:
+                Model.fit()
+                rank()
+
+            if callback is not None:
+                callback(Task, Name, Results, Seconds)
+            Elapsed = time.perf_counter() - Start
+            print(f"\r{Done}/{len(tasks)} tasks, {Elapsed:.0f}s elapsed, ~{Elapsed/Done*(len(tasks)-Done):.0f}s left   ", end='', file=sys.stderr)
+    print(file=sys.stderr)
+    Model.fit()
+    Model.save()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CDIX, STEPIX and/or Stairfit over a cohort on all cores.")
+    parser.add_argument('--mef', nargs='+', default=[], help="MEF files, optionally as NAME=PATH (ie: APBV1='DMScan/Multicentre 146/MSF2 APB-1 146.MEF')")
+    parser.add_argument('--catalog', action='store_true', help="select paired V1/V2 scans from the scan catalog instead of MEF files")
+    parser.add_argument('--folder', help="catalog folder (ie: 'DMScan/Multicentre 146')")
+    parser.add_argument('--muscle', help="catalog muscle: APB, ADM or TA")
+    parser.add_argument('--centre', help="catalog centre (ie: DK-AAR)")
+    parser.add_argument('--variant', help="catalog file name variant (ie: OM2)")
+    parser.add_argument('--method', nargs='+', choices=sorted(GRIDS), default=sorted(GRIDS), help="methods to run")
+    parser.add_argument('--grid', nargs=3, type=float, metavar=('START', 'STOP', 'NUM'), help="np.linspace parameter grid, overriding the method defaults")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--out', default='DMScan_excel/results.csv', help="CSV the results are streamed to")
+    parser.add_argument('--runtimes', default=None, help="JSON of observed runtimes used to schedule longest tasks first (default: next to --out)")
+    parser.add_argument('--cube', default=None, help="results cube directory, started fresh every run unless --append is given (default: results.cube next to --out)")
+    parser.add_argument('--append', action='store_true', help="keep the scans of earlier runs in the cube, replacing only those run again")
+    parser.add_argument('--excel', default=None, help="finally export the cube to per-condition workbooks under this directory (ie: DMScan_excel)")
+    args = parser.parse_args(argv)
+
+    Conditions = mef_conditions(args.mef)
+    if args.catalog:
+        Conditions.update(catalog_conditions(args.folder, args.muscle, args.centre, args.variant))
+    if not Conditions:
+        parser.error("give --mef files or --catalog")
+
+    Grids = dict(GRIDS)
+    if args.grid is not None:
+        Grids = {Method: np.linspace(args.grid[0], args.grid[1], int(args.grid[2])) for Method in GRIDS}
+
+    Tasks = build_tasks(Conditions, args.method, Grids)
+    Runtimes = args.runtimes or os.path.join(os.path.dirname(args.out), 'runtimes.json')
+    Cube = ResultsCube(args.cube or os.path.join(os.path.dirname(args.out), 'results.cube'))
+    if not args.append:
+        Cube.clear()            # the cube holds this run only, like the CSV
+    run(Tasks, args.out, args.processes, model=CostModel(Runtimes), cube=Cube)
+    if args.excel is not None:
+        Cube.to_excel(args.excel)
+
+
+if __name__ == '__main__':
+    main()
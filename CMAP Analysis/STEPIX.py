@@ -2,19 +2,26 @@ import numpy as np
 
 class SETPIX:
     def __init__(self, DataAmps, NoiseThreshold=0.02):
-        """Initialize the SETPIX class."""
+        """Initialize the SETPIX class; for a sequence of NoiseThreshold values every result is an array indexed by threshold."""
         self.DataAmps = DataAmps
 
-        self.STEPIX, self.AMPIX, self.D50, self.Point = self._Calc_Values(NoiseThreshold)
+        if np.ndim(NoiseThreshold) > 0:
+            self.STEPIX, self.AMPIX, self.D50, self.Point = self._Calc_Batch(np.asarray(NoiseThreshold, dtype=float))
+        else:
+            self.STEPIX, self.AMPIX, self.D50, self.Point = self._Calc_Values(NoiseThreshold)
+
+    def _Sorted_Steps(self):
+        """Return the step sizes between neighbouring sorted amplitudes in ascending order, and the largest amplitude."""
+        SortedAmps=np.flip(np.sort(self.DataAmps))
+        StepAmps=SortedAmps[:-1] - SortedAmps[1:]
+        return np.sort(StepAmps), (max(self.DataAmps) if len(self.DataAmps) else np.nan)
 
     def _Calc_Values(self, NoiseThreshold):
         """Calculate the SETPIX values."""
         try:
-            SortedAmps=np.flip(np.sort(self.DataAmps))
-
-            StepAmps = SortedAmps[:-1] - SortedAmps[1:]
+            Ascending, MaxAmp = self._Sorted_Steps()
 
-            SortedStepAmps=np.flip(np.sort(StepAmps))
+            SortedStepAmps=np.flip(Ascending)
 
 
 
@@ -63,12 +70,68 @@ class SETPIX:
                     Q_Step=Q_Step-1
                     Q_Amp=SortedStepAmps[Q_Step-1]
 
-            AMPIX=1000*max(self.DataAmps)/STEPIX
+            AMPIX=1000*MaxAmp/STEPIX
         except:
             return np.nan, np.nan, np.nan, np.nan
 
         return STEPIX, AMPIX, D50, Point
 
+    def _Calc_Batch(self, NoiseThresholds):
+        """Calculate the SETPIX values for every noise threshold from one sort of the amplitudes and step sizes."""
+        T=len(NoiseThresholds)
+        STEPIX=np.full(T, np.nan)
+        AMPIX=np.full(T, np.nan)
+        D50=np.full(T, np.nan)
+        Point=np.full(T, np.nan, dtype=object)
+
+        Ascending, MaxAmp = self._Sorted_Steps()
+        SortedStepAmps=np.flip(Ascending)
+        N=len(SortedStepAmps)
+        Reconstruction=np.cumsum(SortedStepAmps)
+        Scalar=np.ones(T, dtype=bool)
+
+        if N>0 and Reconstruction[-1]>0:
+            # D50 does not depend on the threshold
+            D50_All=np.searchsorted(Reconstruction, Reconstruction[-1]/2, side='right')+1
+            Reconstruction_Percentage=100*Reconstruction/Reconstruction[-1]
+
+            # StepActivation is the leading run of steps above 2.5x the threshold; fit its log-linear trend from prefix sums
+            K=N-np.searchsorted(Ascending, 2.5*NoiseThresholds, side='right')
+            LogN=np.log(np.arange(1, N+1))
+            Sx=np.concatenate([[0], np.cumsum(LogN)])[K]
+            Sxx=np.concatenate([[0], np.cumsum(LogN**2)])[K]
+            Sy=np.concatenate([[0], Reconstruction])[K]
+            Sxy=np.concatenate([[0], np.cumsum(SortedStepAmps*LogN)])[K]
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                a=(K*Sxy-Sx*Sy)/(K*Sxx-Sx**2)
+                b=(Sy-a*Sx)/K
+                PExact=np.exp(-b/a)
+            Regular=(K>=2) & np.isfinite(PExact) & (PExact>=1) & (PExact<N) & (np.abs(PExact-np.floor(PExact)-0.5)>1e-6)
+            P_Step=np.where(Regular, np.round(np.where(Regular, PExact, 1)), 1).astype(np.intp)
+
+            m=np.where(N>P_Step, Reconstruction_Percentage[P_Step-1]/P_Step, 100/P_Step)
+            QExact=80/m
+            Regular&=np.abs(QExact-np.floor(QExact)-0.5)>1e-6
+            Q_Step=np.round(QExact).astype(np.intp)
+            Q_Step=np.where(N<=Q_Step, N-1, Q_Step)
+
+            # Walking Q back to the last step at or above the threshold is a count over the descending steps
+            Count=N-np.searchsorted(Ascending, NoiseThresholds, side='left')
+            Regular&=(Q_Step>=1) & (Count>=1)
+            Steps=np.minimum(Q_Step, Count)
+
+            STEPIX[Regular]=Steps[Regular]
+            AMPIX[Regular]=1000*MaxAmp/Steps[Regular]
+            D50[Regular]=D50_All
+            Point[Regular]=np.where(Q_Step<=Count, "Q", "R")[Regular]
+            Scalar=~Regular
+
+        # Degenerate fits and rounding ties go through the exact scalar path
+        for i in np.flatnonzero(Scalar):
+            STEPIX[i], AMPIX[i], D50[i], Point[i] = self._Calc_Values(NoiseThresholds[i])
+
+        return STEPIX, AMPIX, D50, Point
+
 # Fig2=go.Figure()
 # Fig2.add_trace(go.Scatter(x=Xs, y=SortedStepAmps, marker=dict(color="#FF0000",size=3), mode='markers'))
 # Fig2.add_trace(go.Scatter(x=[Q_Step], y=[Q_Amp], marker=dict(color="#00FF00",size=6), mode='markers'))
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from MEMReader import MEMRecord, PARSER_VERSION
+
+CACHE_DIR = os.environ.get("MUNE_SCAN_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".scancache"))    # Empty string disables caching
+MAX_BYTES = 2**30                                                 # Size bound of the cache before LRU eviction
+
+class ScanCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        """
+        Content-addressed cache of parsed MEM records.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None       # Running size of the cache, measured on the first write
+
+    def key(self, filename):
+        """Return the cache key of a file: a hash of its content and the parser version."""
+        with open(filename, 'rb') as file:
+            Digest = hashlib.sha1(file.read())
+        Digest.update(f"MEMReader-{PARSER_VERSION}".encode())
+        return Digest.hexdigest()
+
+    def load(self, filename):
+        """Return the MEMRecord of a file, parsing and storing it on a miss."""
+        Key = self.key(filename)
+        DataPath, MetaPath = self._paths(Key)
+        try:
+            Record = self._read(DataPath, MetaPath)
+            os.utime(MetaPath)      # Mark as recently used for LRU eviction
+        except (OSError, ValueError):
+            Record = MEMRecord(filename)
+            self._write(Key, Record)
+        Record.filename = filename
+        return Record
+
+    def warm(self, filenames, processes=None):
+        """Parse and store every file that is not cached yet, in parallel."""
+        with Pool(processes) as pool:
+            Stored = pool.map(self._warm_file, filenames, chunksize=16)
+        self._size = None
+        self._evict()
+        return sum(Stored)
+
+    def _warm_file(self, filename):
+        try:
+            Key = self.key(filename)
+            if os.path.exists(self._paths(Key)[1]):
+                return 0
+            self._write(Key, MEMRecord(filename), evict=False)
+        except (OSError, ValueError):
+            return 0        # unreadable files are left for DataHandler to report
+        return 1
+
+    def _paths(self, Key):
+        Base = os.path.join(self.directory, Key[:2], Key)
+        return Base + ".npy", Base + ".json"
+
+    def _read(self, DataPath, MetaPath):
+        """Rebuild a record from its metadata and one memory-mapped array."""
+        with open(MetaPath, 'r') as file:
+            Meta = json.load(file)
+        Data = np.load(DataPath, mmap_mode='r')
+
+        Record = MEMRecord()
+        Record.header = Meta["header"]
+        Record.results = Meta["results"]
+        Record.scanpts = Meta["scanpts"]
+        Offset = 0
+        for Length in Meta["blocks"]:
+            Record.blocks.append((Data[Offset:Offset+Length], Data[Offset+Length:Offset+2*Length]))
+            Offset += 2*Length
+        Record.model = Data[Offset:].reshape(Meta["model"])
+        return Record
+
+    def _write(self, Key, Record, evict=True):
+        """Store a record as one flat .npy array plus a small JSON sidecar."""
+        DataPath, MetaPath = self._paths(Key)
+        os.makedirs(os.path.dirname(DataPath), exist_ok=True)
+
+        Arrays = [Array for Block in Record.blocks for Array in Block] + [Record.model.ravel()]
+        Meta = {"header": Record.header,
+                "results": Record.results,
+                "scanpts": Record.scanpts,
+                "blocks": [len(Block[0]) for Block in Record.blocks],
+                "model": list(Record.model.shape)}
+
+        # Write to temporary names and rename, so concurrent readers and writers never see partial files
+        Temp = f".{os.getpid()}.tmp"
+        np.save(DataPath + Temp + ".npy", np.concatenate(Arrays).astype(np.float64))
+        with open(MetaPath + Temp, 'w') as file:
+            json.dump(Meta, file)
+        os.replace(DataPath + Temp + ".npy", DataPath)
+        os.replace(MetaPath + Temp, MetaPath)
+
+        if evict:
+            if self._size is not None:
+                self._size += os.path.getsize(DataPath) + os.path.getsize(MetaPath)
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used records until the cache is below 90% of max_bytes."""
+        if self._size is not None and self._size <= self.max_bytes:
+            return
+
+        Entries = []
+        for Root, _, Files in os.walk(self.directory):
+            for File in Files:
+                if File.endswith(".json"):
+                    MetaPath = os.path.join(Root, File)
+                    DataPath = MetaPath[:-5] + ".npy"
+                    Size = os.path.getsize(MetaPath) + (os.path.getsize(DataPath) if os.path.exists(DataPath) else 0)
+                    Entries.append((os.path.getmtime(MetaPath), Size, DataPath, MetaPath))
+        self._size = sum(Entry[1] for Entry in Entries)
+        if self._size <= self.max_bytes:
+            return
+
+        for _, Size, DataPath, MetaPath in sorted(Entries):
+            for Path in (MetaPath, DataPath):
+                try:
+                    os.remove(Path)
+                except OSError:
+                    pass
+            self._size -= Size
+            if self._size <= 0.9*self.max_bytes:
+                break
+
+
+DEFAULT_CACHE = ScanCache() if CACHE_DIR else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the parsed scan cache.")
+    parser.add_argument("command", choices=["warm"], help="warm: parse and cache every MEM file under the given paths")
+    parser.add_argument("paths", nargs="+", help="MEM files or directories to search recursively")
+    parser.add_argument("--cache", default=CACHE_DIR, help="cache directory")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help="size bound of the cache")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            for Root, _, Files in os.walk(path):
+                filenames.extend(os.path.join(Root, File) for File in sorted(Files) if File.lower().endswith('.mem'))
+        else:
+            filenames.append(path)
+
+    Stored = ScanCache(args.cache, args.max_bytes).warm(filenames, args.processes)
+    print(f"Cached {Stored} of {len(filenames)} scans in {args.cache}", file=sys.stderr)
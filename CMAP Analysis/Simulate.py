@@ -6,6 +6,9 @@ from scipy.stats import expon
 
 ## Chen, M., Lu, Z., Zong, Y., Li, X., & Zhou, P. (2023). A Novel Analysis of Compound Muscle Action Potential Scan: Staircase Function Fitting and StairFit Motor Unit Number Estimation. In IEEE Journal of Biomedical and Health Informatics (Vol. 27, Issue 3, pp. 1579–1587). Institute of Electrical and Electronics Engineers (IEEE). https://doi.org/10.1109/jbhi.2022.3229211
 
+MAX_BYTES = 2**26   # Peak working memory for one tile of the stimulus x unit activation tensors
+
+
 class CMAPSim:
 
     def __init__(self, NCells, alpha1=200, beta1=25, alpha2=12, beta2=1, alpha3=0, beta3=0.02, length=500, noiseoffset=10, noisedev=5, method="Stairfit", seed=0):
@@ -26,32 +29,89 @@ class CMAPSim:
 
     def _simulate_amplitudes(self):
         """Simulate amplitude responses."""
-        Sizes = expon.rvs(scale=self.alpha1, loc=self.beta1, size=self.NCells, random_state=self.rng)
-        Thresholds = self.rng.normal(self.alpha2, self.beta2, self.NCells)
-        Spreads = self.rng.uniform(self.alpha3, self.beta3, self.NCells)
-        Devs = Spreads * Thresholds
-        baselinenoise = self.rng.normal(self.noiseoffset, self.noisedev, self.length)
-        minstim = min(Thresholds) - 0.5
-        maxstim = max(Thresholds) + 0.5
+        Sizes, Thresholds, Devs, baselinenoise = self._draw_pool(self.rng)
 
-        ModelStims = np.linspace(minstim, maxstim, self.length)
-        ModelAmps = [self._calculate_amplitude(Sizes, Thresholds, Devs, stim) for stim in ModelStims]
-        ModelAmps = np.array(ModelAmps) + baselinenoise
+        ModelStims = np.linspace(Thresholds.min() - 0.5, Thresholds.max() + 0.5, self.length)
+        ModelAmps = self._calculate_amplitudes([self.rng], Sizes[None], Thresholds[None], Devs[None], ModelStims[None])[0]
+        ModelAmps = ModelAmps + baselinenoise
         return ModelStims, ModelAmps
-    
+
+    def _draw_pool(self, rng):
+        """Draw the motor unit sizes, thresholds, deviations and baseline noise of one scan."""
+        Sizes = expon.rvs(scale=self.alpha1, loc=self.beta1, size=self.NCells, random_state=rng)
+        Thresholds = rng.normal(self.alpha2, self.beta2, self.NCells)
+        Spreads = rng.uniform(self.alpha3, self.beta3, self.NCells)
+        Devs = Spreads * Thresholds
+        baselinenoise = rng.normal(self.noiseoffset, self.noisedev, self.length)
+        return Sizes, Thresholds, Devs, baselinenoise
+
     def _calculate_probabilities(self, Thresholds, Devs, stim):
         """Calculate the sigmoid response probabilities for each unit."""
         return (erf((1/(np.sqrt(2)*Devs))*(stim-Thresholds))+1)/2
-        
-
-    def _calculate_amplitude(self, Sizes, Thresholds, Devs, stim):
-        """Determine activation of each unit based on its probability for a given stimulus."""
-        PVal = self._calculate_probabilities(Thresholds, Devs, stim)
-        Roll = self.rng.uniform(0, 1, len(Sizes))
-        Bool = Roll <= PVal
-        Amps = Sizes * Bool.astype(int)
-        return np.sum(Amps)
-    
+
+    def _calculate_amplitudes(self, rngs, Sizes, Thresholds, Devs, Stims, dtype=np.float64, max_bytes=MAX_BYTES):
+        """
+        Determine the summed activation of every replicate at every stimulus.
+
+        Sizes, Thresholds and Devs are (replicates x units), Stims is (replicates x samples) and
+        rngs holds one generator per replicate. The stimulus axis is processed in tiles so that the
+        (replicates x tile x units) probability, roll and activation arrays stay below max_bytes.
+        Each replicate draws its rolls in stimulus order from its own generator, so a float64 run
+        consumes the same random stream as rolling one stimulus at a time.
+        """
+        NReps, NUnits = Sizes.shape
+        Sizes = Sizes.astype(dtype)[:, None, :]
+        Thresholds = Thresholds.astype(dtype)[:, None, :]
+        Devs = Devs.astype(dtype)[:, None, :]
+        Stims = Stims.astype(dtype)
+
+        Tile = max(1, int(max_bytes // (4 * NReps * NUnits * np.dtype(dtype).itemsize)))
+        Amps = np.empty(Stims.shape, dtype=dtype)
+        Roll = np.empty((NReps, min(Tile, Stims.shape[1]), NUnits), dtype=dtype)
+
+        for start in range(0, Stims.shape[1], Tile):
+            stop = min(start + Tile, Stims.shape[1])
+            PVal = self._calculate_probabilities(Thresholds, Devs, Stims[:, start:stop, None])
+            for i, rng in enumerate(rngs):
+                if dtype == np.float64:
+                    Roll[i, :stop-start] = rng.uniform(0, 1, (stop-start, NUnits))
+                else:
+                    rng.random((stop-start, NUnits), dtype=dtype, out=Roll[i, :stop-start])
+            Bool = Roll[:, :stop-start] <= PVal
+            Amps[:, start:stop] = np.sum(Sizes * Bool, axis=-1)
+        return Amps
+
+
+class CMAPSimBatch(CMAPSim):
+
+    def __init__(self, NCells, NReps=1, alpha1=200, beta1=25, alpha2=12, beta2=1, alpha3=0, beta3=0.02, length=500, noiseoffset=10, noisedev=5, method="Stairfit", seed=0, seeds=None, dtype=np.float64, max_bytes=MAX_BYTES):
+        """
+        Initialize a batch of independent simulations computed in one vectorized pass.
+
+        Replicate streams are spawned from seed, or taken one per entry of seeds, in which case
+        replicate i reproduces CMAPSim(..., seed=seeds[i]) exactly in float64 mode. x and y are
+        (replicates x length) arrays; Sizes, Thresholds and Devs are (replicates x NCells).
+        dtype=np.float32 halves the memory of the activation tensors at the cost of a separate
+        random stream.
+        """
+        if seeds is None:
+            seeds = np.random.SeedSequence(seed).spawn(NReps)
+        self.rngs = [np.random.default_rng(s) for s in seeds]
+        self.NReps = len(self.rngs)     # Number of independent scans
+        self.dtype = np.dtype(dtype)    # Working precision of the activation tensors
+        self.max_bytes = max_bytes      # Peak memory of one stimulus tile
+        super().__init__(NCells, alpha1, beta1, alpha2, beta2, alpha3, beta3, length, noiseoffset, noisedev, method, seed)
+
+    def _simulate_amplitudes(self):
+        """Simulate amplitude responses for every replicate."""
+        Pools = [self._draw_pool(rng) for rng in self.rngs]
+        self.Sizes, self.Thresholds, self.Devs, baselinenoise = [np.stack(x) for x in zip(*Pools)]
+
+        ModelStims = np.linspace(self.Thresholds.min(axis=1) - 0.5, self.Thresholds.max(axis=1) + 0.5, self.length, axis=1)
+        ModelAmps = self._calculate_amplitudes(self.rngs, self.Sizes, self.Thresholds, self.Devs, ModelStims, self.dtype, self.max_bytes)
+        ModelAmps = ModelAmps + baselinenoise.astype(self.dtype)
+        return ModelStims.astype(self.dtype), ModelAmps
+
 
 
 # Cells = 160      # Number of Motor Units
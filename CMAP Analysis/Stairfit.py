@@ -1,33 +1,41 @@
 import numpy as np
-import os
-os.environ["OMP_NUM_THREADS"] = '2'
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import scipy.optimize as optimize
-from sklearn.cluster import KMeans
 
 class Stairfit:
     def __init__(self, StimData, AmpData, MURange=range(5,251), termination_threshold=0.015, Calc_Thres=False, PlotResult=False, seed=0):
         """
         Initialize the Stairfit class.
+        termination_threshold may be a single value or a sequence; for a sequence M, Lambdas, Sizes and Diff hold one entry per threshold.
+        The threshold fit is exact and deterministic; seed is kept for compatibility.
         """
         self.StimData = StimData
         self.AmpData = AmpData
-
-
-        lbLam = min(AmpData)
-        ubLam = max(AmpData)
-
-        self.M, self.Lambdas, self.Sizes = self._optimize_lambda(MURange, lbLam, ubLam, termination_threshold)
-
-        self.Diff=0
-
-        if len(self.Sizes)>len(np.unique(self.Sizes)):
-            self.Diff=len(self.Sizes)-len(np.unique(self.Sizes))
-            print(f"Sizes are non-unique! There are {self.Diff} repititions.")
+        self.Errors = []        # mean distance to the nearest of M+1 optimal levels, indexed by M
+        self._fits = {}         # memoized (Lambdas, Sizes) per M
+
+        Vector = np.ndim(termination_threshold) > 0
+        Ms = self._optimize_lambda(MURange, np.atleast_1d(termination_threshold))
+        Fits = [self.fit(M) for M in Ms]
+        Diffs = [len(Sizes)-len(np.unique(Sizes)) for _, Sizes in Fits]
+
+        for Diff in Diffs:
+            if Diff>0:
+                print(f"Sizes are non-unique! There are {Diff} repititions.")
+
+        if Vector:
+            self.M = np.array(Ms)
+            self.Lambdas = [Lambdas for Lambdas, _ in Fits]
+            self.Sizes = [Sizes for _, Sizes in Fits]
+            self.Diff = np.array(Diffs)
+            if Calc_Thres==True or PlotResult==True:
+                raise ValueError("Calc_Thres and PlotResult need a single termination_threshold")
+        else:
+            self.M = Ms[0]
+            self.Lambdas, self.Sizes = Fits[0]
+            self.Diff = Diffs[0]
 
         if Calc_Thres==True:
-            self.rng = np.random.default_rng(seed=seed)
             lbThres= min(StimData)
             ubThres= max(StimData)
             self.Thresholds = self._optimize_threshold(lbThres, ubThres)
@@ -38,79 +46,167 @@ class Stairfit:
         if PlotResult==True:
             self._generate_plot()
 
-    def _optimize_lambda(self, MURange, lbLam, ubLam, termination_threshold):
+    def fit(self, M):
         """
-        Optimize the lambda parameters.
+        Return the memoized optimal Lambdas (M+1 levels) and Sizes for a given M.
         """
-        y = self.AmpData.reshape(-1, 1)
-        
-        def OptLam(lam, Data):
-            Data = Data.reshape(-1, 1)
-            diff = np.abs(Data - lam)
-            min_diff = np.min(diff, axis=1)
-            return np.mean(min_diff)
-        
-        # Initialize variables
-        M = None
-        Lambdas = None
-        Sizes = None
+        if M not in self._fits:
+            self._extend_curve(M)
+            Lambdas = self._kmedian_levels(M+1)
+            self._fits[M] = (Lambdas, np.diff(Lambdas))
+        return self._fits[M]
+
+    def _optimize_lambda(self, MURange, Thresholds):
+        """
+        Find, for every termination threshold, the first M whose M+1 optimal levels are within it of the data on average.
+        """
+        # One ascending pass over M serves every threshold, loosest first
+        Order = list(np.argsort(-Thresholds, kind="stable"))
+        Ms = [None]*len(Thresholds)
 
         for M in MURange:
-            #print(M)
-
-            kmeans = KMeans(n_clusters=M+1, init='k-means++', n_init=10, random_state=0)
-            kmeans.fit(y)
-            lambda_init = kmeans.cluster_centers_
-
-            lambda_init = np.clip(np.sort(lambda_init.reshape(-1)),lbLam,ubLam)
-
-            Bounds = ([lbLam, ubLam],)*(M+1)
-            result = optimize.minimize(OptLam, lambda_init, args=(self.AmpData), method='Nelder-Mead', bounds=Bounds)
-            Lambdas = np.sort(result.x)
-            Error = OptLam(Lambdas, self.AmpData)
-            if Error < termination_threshold or M>250:
-                diff=[]
-                for i in range(len(Lambdas)-1):
-                    diff.append(Lambdas[i+1]-Lambdas[i])
-                Sizes=np.array(diff)
+            Error = self._extend_curve(M)
+            while Order and (Error < Thresholds[Order[0]] or M>250):
+                Ms[Order.pop(0)] = M
+            if not Order:
                 break
-            
-         # Check if Sizes, Lambdas, and M were assigned
-        if Sizes is None or Lambdas is None or M is None:
+
+         # Check if every threshold was met
+        if Order:
             raise ValueError("Failed to optimize lambda parameters within the given range")
-           
-        return M, Lambdas, Sizes
 
-    def _optimize_threshold(self, lb, ub):
+        return Ms
+
+    def _extend_curve(self, M):
         """
-        Optimize the threshold parameters.
+        Extend the exact 1-D k-median dynamic program over the sorted amplitudes up to M+1 levels and return the error for M.
         """
-        x = self.StimData
-        y = self.AmpData
-        lam = self.Lambdas
-
-        thr_init = self.rng.uniform(lb,ub,self.M)
-
-        Bounds = ([lb,ub],)*(self.M)
-
-        Datax = x.reshape(-1,1)
-        Datay = y.reshape(-1,1)
-        newlams = np.repeat(lam,2)[1:-1]
+        if not self.Errors:
+            self._Sorted = np.sort(np.asarray(self.AmpData, dtype=float))
+            self._Prefix = np.concatenate([[0], np.cumsum(self._Sorted)])
+            N = len(self._Sorted)
+
+            self._D = np.full(N+1, np.inf)
+            self._D[1:] = self._cost(np.zeros(N, dtype=np.intp), np.arange(1, N+1))
+            self._Back = [None]
+            self.Errors.append(self._D[N]/N)
+
+        N = len(self._Sorted)
+        while len(self.Errors) <= M:
+            if self.Errors[-1] == 0 or len(self.Errors) >= N:
+                self.Errors.append(self.Errors[-1])      # every level already sits on a distinct value
+                continue
+            self._D, Back = self._add_level(self._D)
+            self._Back.append(Back)
+            self.Errors.append(self._D[N]/N)
+        return self.Errors[M]
+
+    def _cost(self, i, j):
+        """
+        Cost of one level at the median of Sorted[i:j], from prefix sums, for index arrays i < j.
+        """
+        Sorted = self._Sorted
+        Prefix = self._Prefix
+        m = (i+j-1)//2
+        return Sorted[m]*(m-i) - (Prefix[m]-Prefix[i]) + (Prefix[j]-Prefix[m+1]) - Sorted[m]*(j-m-1)
 
-        def OptThr(thr):
-            thr = np.sort(thr)
-            newthr = np.repeat(thr,2)
-            A = self._Dm(Datax, Datay, newthr, newlams)
-            index = np.searchsorted(thr, x, side='left')
-            centerlams = lam[index]
-            B = self._ydist(y, centerlams)
-            ManDis = np.c_[A,B]
-            min_diff = np.min(ManDis, axis=1)
-            return np.sum(min_diff)
+    def _add_level(self, D):
+        """
+        Given the best cost D[i] of k levels over Sorted[:i], return the best cost of k+1 levels over Sorted[:j] and the
+        start i of its last level, for every j. The cost is Monge, so the leftmost optimal i never decreases with j:
+        solving the midpoints of all open ranges of j at once bounds the split of their halves, which takes O(N log N)
+        time and O(N) memory instead of an (N+1)^2 cost matrix.
+        """
+        N = len(D) - 1
+        Best = np.full(N+1, np.inf)
+        Back = np.zeros(N+1, dtype=np.intp)
+
+        # Open ranges [Lo, Hi] of j, with the range [OptLo, OptHi] holding their optimal i
+        Lo, Hi = np.array([1]), np.array([N])
+        OptLo, OptHi = np.array([0]), np.array([N-1])
+        while len(Lo):
+            Mid = (Lo+Hi)//2
+            Counts = np.minimum(OptHi, Mid-1) - OptLo + 1
+            Starts = np.concatenate([[0], np.cumsum(Counts)[:-1]])
+            Range = np.repeat(np.arange(len(Mid)), Counts)
+            i = np.arange(Counts.sum()) - Starts[Range] + OptLo[Range]
+            Total = D[i] + self._cost(i, Mid[Range])
+
+            Minima = np.flatnonzero(Total == np.minimum.reduceat(Total, Starts)[Range])
+            Pick = Minima[np.unique(Range[Minima], return_index=True)[1]]      # leftmost minimum of every range
+            Opt = i[Pick]
+            Best[Mid] = Total[Pick]
+            Back[Mid] = Opt
+
+            Left = Lo < Mid
+            Right = Mid < Hi
+            Lo, Hi = np.concatenate([Lo[Left], Mid[Right]+1]), np.concatenate([Mid[Left]-1, Hi[Right]])
+            OptLo, OptHi = np.concatenate([OptLo[Left], Opt[Right]]), np.concatenate([Opt[Left], OptHi[Right]])
+        return Best, Back
+
+    def _kmedian_levels(self, k):
+        """
+        Recover the k optimal levels (segment medians) by following the back-pointers.
+        """
+        Sorted = self._Sorted
+        k = min(k, len(self._Back))
+        Levels = []
+        j = len(Sorted)
+        for Layer in range(k-1, -1, -1):
+            i = self._Back[Layer][j] if Layer > 0 else 0
+            Levels.append(Sorted[(i+j-1)//2])
+            j = i
+        return np.array(Levels[::-1])
 
-        result2 = optimize.minimize(OptThr, thr_init, method='Powell', bounds=Bounds, options={'disp': True, 'xtol': 1e-07})
+    def _optimize_threshold(self, lb, ub):
+        """
+        Place the M thresholds exactly by a monotone segmentation DP over the data sorted by stimulus.
+        Every point takes the level of the number of thresholds below its stimulus, minimizing the sum of |y - level|.
+        """
+        Order = np.argsort(self.StimData, kind="stable")
+        x = np.asarray(self.StimData, dtype=float)[Order]
+        y = np.asarray(self.AmpData, dtype=float)[Order]
+        lam = self.Lambdas
+        N = len(x)
+        K = len(lam)
+
+        # A threshold can only fall between two distinct stimuli; thresholds are bounded below by lb, so the lowest stimulus stays on level 0
+        Blocked = np.zeros(N+1, dtype=bool)
+        Blocked[0] = True
+        Blocked[1:N] = x[1:] == x[:-1]
+        Index = np.arange(N+1)
+
+        F = np.empty(N+1)           # F[n]: best cost of the first n points on the levels so far
+        Prefix = np.empty(N+1)      # Prefix[n]: sum of |y - lam[k]| over the first n points
+        Start = np.empty(N+1)
+        Arg = np.empty(N+1, dtype=np.intp)
+        Back = np.empty((K, N+1), dtype=np.intp)     # Back[k, n]: first point on level k when n points use levels up to k
+
+        Prefix[0] = 0
+        np.cumsum(np.abs(y-lam[0]), out=Prefix[1:])
+        F[:] = Prefix
+        Back[0] = 0
+        for k in range(1, K):
+            Prefix[0] = 0
+            np.cumsum(np.abs(y-lam[k]), out=Prefix[1:])
+
+            # F_k[n] = Prefix[n] + min over s <= n of (F_k-1[s] - Prefix[s]), a running minimum
+            np.subtract(F, Prefix, out=Start)
+            Start[Blocked] = np.inf
+            np.minimum.accumulate(Start, out=F)
+            np.copyto(Arg, Index)
+            Arg[Start != F] = 0
+            np.maximum.accumulate(Arg, out=Back[k])
+            F += Prefix
+
+        # Walk the back-pointers to the first point of every level; thresholds sit midway between stimuli
+        Thresholds = np.empty(K-1)
+        n = N
+        for k in range(K-1, 0, -1):
+            s = Back[k, n]
+            Thresholds[k-1] = ub if s == N else (x[s-1]+x[s])/2
+            n = s
 
-        Thresholds = np.sort(result2.x)
         Thresholds = np.concatenate([[lb],Thresholds,[ub]])
         
         return Thresholds
@@ -147,15 +243,3 @@ class Stairfit:
         Fig.update_yaxes(title_text="Amplitude (mV)", row=2, col=1)
 
         Fig.show()
-
-    def _Dm(self,datax, datay, modelx, modely):
-        """
-        Calculate Manhattan distance between data and model.
-        """
-        return 0.1*np.abs(datax-modelx) + np.abs(datay-modely)
-
-    def _ydist(self,datay, lam):
-        """
-        Calculate absolute distance between data y and lambda.
-        """
-        return np.abs(datay-lam)
@@ -0,0 +1,263 @@
+import os
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from scipy.stats import norm
+
+MEANS_SHEETS = ["Mean", "Std", "Coeff_Var", "Median", "IQR", "IQR_CV"]     # sheets of {prefix}_Means.xlsx, in order
+INTERVAL_SHEETS = ["Low", "High", "BCa_Low", "BCa_High"]                    # bootstrap sheets of the ICC and RC workbooks
+
+def pair_files(directory="."):
+    """Return {prefix: (V1 file, V2 file)} for workbooks named <stem>1.xlsx / <stem>2.xlsx, the prefix being stem[:2]."""
+    Files = sorted(f for f in os.listdir(directory) if f.endswith('1.xlsx') or f.endswith('2.xlsx'))
+    Pairs = {}
+    for File in Files:
+        Stem = File[:-len('1.xlsx')]
+        if File.endswith('1.xlsx') and f'{Stem}2.xlsx' in Files:
+            Pairs[Stem[:2]] = (os.path.join(directory, File), os.path.join(directory, f'{Stem}2.xlsx'))
+    return Pairs
+
+def load_pair(V1File, V2File):
+    """
+    Read a V1/V2 pair of analysis workbooks once into a (subject x visit x parameter x threshold) tensor.
+    Sheets pair by name, either identical (ie: AR18E) or by visit suffix (ie: CA.EDM.NC.1.1 and CA.EDM.NC.1.2);
+    unpaired subjects and non-numeric cells are NaN. Returns the tensor, subjects, parameters and thresholds.
+    """
+    DataV1 = pd.read_excel(V1File, None, index_col=0)
+    DataV2 = pd.read_excel(V2File, None, index_col=0)
+
+    First = DataV1[next(iter(DataV1))]
+    Thresholds = [Column for Column in First.columns if Column != 'Filename']
+    Params = list(First.index)
+    # For STEPIX and Stairfit the last row (Point, Diff) is not analysed
+    if Params[0] != "Gridsize":
+        Params = Params[:-1]
+
+    Subjects = []
+    Tensor = np.full((len(DataV1), 2, len(Params), len(Thresholds)), np.nan)
+    for Name, Sheet in DataV1.items():
+        NameV2 = Name if Name in DataV2 else Name[:-2]+".2"
+        if NameV2 not in DataV2:
+            continue
+        for Visit, Data in enumerate((Sheet, DataV2[NameV2])):
+            Values = Data.reindex(index=Params, columns=Thresholds)
+            Tensor[len(Subjects), Visit] = Values.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        Subjects.append(Name[:-2] if Name.endswith('.1') else Name)
+
+    return Tensor[:len(Subjects)], Subjects, Params, Thresholds
+
+def load_cube(Cube, Muscle, Method):
+    """
+    Read the V1/V2 results of one muscle and method from a ResultsCube as a (subject x visit x parameter x threshold)
+    tensor, the outputs being the parameters and the method's grid the thresholds. Returns as load_pair.
+    """
+    Values, Labels = Cube.select(visit=[1, 2], muscle=Muscle, method=Method)     # (subject x visit x grid x output)
+    Stored = ~np.isnan(Values)
+    Subjects = np.flatnonzero(Stored.any(axis=(1,2,3)))
+    Thresholds = np.flatnonzero(Stored.any(axis=(0,1,3)))
+    # As for the workbooks, Point (categorical) and Diff are not analysed
+    Params = [o for o in np.flatnonzero(Stored.any(axis=(0,1,2))) if Labels["output"][o] not in Cube.categories and Labels["output"][o] != "Diff"]
+    Names = [Labels["output"][o] for o in Params]
+
+    Tensor = Values[np.ix_(Subjects, [0, 1], Thresholds, Params)].transpose(0, 1, 3, 2)
+    return Tensor, [Labels["subject"][s] for s in Subjects], Names, [Labels["parameter"][t] for t in Thresholds]
+
+def _prepare(Tensor):
+    """Mask of the subjects with both visits per cell, and the tensor centred on each cell's mean with the rest zeroed."""
+    Valid = ~np.isnan(Tensor).any(axis=1)                          # (subject x parameter x threshold)
+    n = Valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Mean = np.where(Valid[:,None], Tensor, 0).sum(axis=(0,1))/(2*n)
+    return Valid, np.where(Valid[:,None], Tensor - np.nan_to_num(Mean), 0)
+
+def _sums(a, b, Mask, axis=0):
+    """Sufficient statistics (n, sum a, sum b, sum a^2 + b^2, sum (a-b)^2) of the paired visits over the subjects in Mask."""
+    a = np.where(Mask, a, 0)
+    b = np.where(Mask, b, 0)
+    return Mask.sum(axis), a.sum(axis), b.sum(axis), (a*a + b*b).sum(axis), ((a-b)**2).sum(axis)
+
+def _reliability(n, Sa, Sb, Sq, Sd):
+    """ICC, SEM and repeatability coefficient from the sufficient statistics, via the two-way ANOVA mean squares of calc_ICC."""
+    k = 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Grand = (Sa + Sb)/(k*n)
+        SStotal = Sq - k*n*Grand**2
+        MSR = k*(Sq/2 - Sd/4 - n*Grand**2)/(n-1)                 # subject means (a+b)/2 about the grand mean
+        MSC = n*((Sa - Sb)/n)**2/2
+        MSE = (SStotal - MSR*(n-1) - MSC*(k-1))/((n-1)*(k-1))
+        ICC = (MSR - MSE) / (MSR + (k-1)*MSE + k*(MSC-MSE)/n)
+        SEM = np.sqrt(np.maximum(Sd/(2*n), 0))                      # root mean within-subject variance (ddof=1)
+    return ICC, SEM, np.sqrt(2)*1.96*SEM
+
+def calc_stats(Tensor):
+    """
+    Reliability and summary statistics of every (parameter, threshold) cell at once.
+    Subjects count in a cell only when both visits are present; returns a dict of (parameter x threshold) arrays.
+    """
+    Valid, Centred = _prepare(Tensor)
+    ICC, SEM, RC = _reliability(*_sums(Centred[:,0], Centred[:,1], Valid))
+
+    # Summaries over both visits pooled
+    Pooled = np.where(Valid[:,None], Tensor, np.nan).reshape(-1, *Tensor.shape[2:])
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)            # cells without pairs are NaN
+        Mean = np.nanmean(Pooled, axis=0)
+        Std = np.nanstd(Pooled, axis=0)
+        Median = np.nanmedian(Pooled, axis=0)
+        Q75, Q25 = np.nanpercentile(Pooled, [75, 25], axis=0)
+        IQR = Q75 - Q25
+
+        return {"ICC": ICC, "SEM": SEM, "RC": RC,
+                "Mean": Mean, "Std": Std, "Coeff_Var": Std/Mean, "Median": Median, "IQR": IQR, "IQR_CV": IQR/Median,
+                "N": Valid.sum(axis=0)}
+
+def _bootstrap_shard(args):
+    """
+    ICC and RC of Replicates resamples of every cell, evaluated as one array operation.
+    One (replicate x draw) matrix of uniforms is shared by all cells and scaled to each cell's count of valid subjects,
+    which Sorted holds first.
+    """
+    Sorted, n, Replicates, Seed = args
+    S = Sorted.shape[0]
+    U = np.random.default_rng(Seed).random((Replicates, S))
+    Index = np.minimum((U[:,:,None,None]*n).astype(np.intp), S-1)    # (replicate x draw x parameter x threshold)
+    Mask = (np.arange(S)[:,None,None] < n)[None]
+    a = np.take_along_axis(Sorted[None,:,0], Index, axis=1)
+    b = np.take_along_axis(Sorted[None,:,1], Index, axis=1)
+    ICC, _, RC = _reliability(*_sums(a, b, Mask, axis=1))
+    return ICC, RC
+
+def _quantile(Sorted, Count, Q):
+    """Linearly interpolated Q quantile per cell of replicates sorted along axis 0, the first Count of which are not NaN."""
+    Position = np.asarray(Q)*(Count - 1)
+    Valid = (Count > 0) & np.isfinite(Position)
+    Position = np.where(Valid, Position, 0)
+    Lower = np.floor(Position).astype(np.intp)
+    Upper = np.minimum(Lower + 1, np.maximum(Count - 1, 0))
+    Low = np.take_along_axis(Sorted, Lower[None], axis=0)[0]
+    High = np.take_along_axis(Sorted, Upper[None], axis=0)[0]
+    with np.errstate(invalid='ignore'):
+        return np.where(Valid, Low + (High - Low)*(Position - Lower), np.nan)
+
+def _intervals(Point, Replicates, Jackknife, JackMask, alpha):
+    """Percentile and BCa (Efron) intervals per cell from the bootstrap replicates and leave-one-out estimates."""
+    Count = np.sum(~np.isnan(Replicates), axis=0)
+    Sorted = np.sort(Replicates, axis=0)
+    z = norm.ppf([alpha/2, 1 - alpha/2])[:,None,None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Bias correction from the share of replicates below the estimate
+        Below = np.sum(Replicates < Point, axis=0) + np.sum(Replicates == Point, axis=0)/2
+        z0 = norm.ppf(Below/Count)
+        # Acceleration from the skewness of the jackknife estimates
+        JackMask = JackMask & np.isfinite(Jackknife)
+        J = np.where(JackMask, Jackknife, 0)
+        D = np.where(JackMask, J.sum(axis=0)/JackMask.sum(axis=0) - J, 0)
+        Acceleration = np.nan_to_num((D**3).sum(axis=0)/(6*((D**2).sum(axis=0))**1.5))
+        Q = norm.cdf(z0 + (z0 + z)/(1 - Acceleration*(z0 + z)))
+
+    return (_quantile(Sorted, Count, alpha/2), _quantile(Sorted, Count, 1 - alpha/2),
+            _quantile(Sorted, Count, Q[0]), _quantile(Sorted, Count, Q[1]))
+
+def bootstrap(Tensor, replicates=2000, alpha=0.05, seed=None, processes=1, shard=250):
+    """
+    Bootstrap confidence intervals of the ICC and repeatability coefficient of every (parameter, threshold) cell.
+    The subjects with both visits are resampled with replacement within each cell; replicates are drawn in shards of
+    shard, each evaluated as one array operation and run on processes workers (None for all cores). Every shard has
+    its own stream spawned from seed, so a seed reproduces the intervals whatever the number of processes.
+    Returns a dict of (parameter x threshold) arrays: ICC_Low, ICC_High, ICC_BCa_Low, ICC_BCa_High and the same for RC.
+    """
+    Valid, Centred = _prepare(Tensor)
+    n = Valid.sum(axis=0)
+    Order = np.argsort(~Valid, axis=0, kind='stable')             # valid subjects first in each cell
+    Sorted = np.take_along_axis(Centred, Order[:,None], axis=0)
+
+    Sizes = [min(shard, replicates - Start) for Start in range(0, replicates, shard)]
+    Args = [(Sorted, n, Size, Seed) for Size, Seed in zip(Sizes, np.random.SeedSequence(seed).spawn(len(Sizes)))]
+    if processes == 1:
+        Shards = list(map(_bootstrap_shard, Args))
+    else:
+        with Pool(processes) as pool:
+            Shards = pool.map(_bootstrap_shard, Args)
+    Replicates = {"ICC": np.concatenate([ICC for ICC, _ in Shards]), "RC": np.concatenate([RC for _, RC in Shards])}
+
+    # Point and leave-one-out estimates by removing each subject's share of the sufficient statistics
+    a, b = Centred[:,0], Centred[:,1]                              # zero outside Valid
+    Sums = _sums(a, b, Valid)
+    Shares = (Valid.astype(int), a, b, a*a + b*b, (a-b)**2)
+    ICC, _, RC = _reliability(*Sums)
+    JackICC, _, JackRC = _reliability(*(Total - Share for Total, Share in zip(Sums, Shares)))
+
+    Intervals = {}
+    for Name, Point, Jackknife in (("ICC", ICC, JackICC), ("RC", RC, JackRC)):
+        Bounds = _intervals(Point, Replicates[Name], Jackknife, Valid, alpha)
+        for Bound, Values in zip(("Low", "High", "BCa_Low", "BCa_High"), Bounds):
+            Intervals[f"{Name}_{Bound}"] = Values
+    return Intervals
+
+def write_stats(prefix, Stats, Params, Thresholds, directory="Stats"):
+    """
+    Write {prefix}_ICC.xlsx, {prefix}_Means.xlsx and {prefix}_RC.xlsx (with SEM on a second sheet);
+    bootstrap intervals in Stats are added to the ICC and RC workbooks as Low, High, BCa_Low and BCa_High sheets.
+    """
+    os.makedirs(directory, exist_ok=True)
+    Frame = lambda Name: pd.DataFrame(Stats[Name], index=Params, columns=Thresholds)
+    Intervals = lambda Name, ExcelWriter: [Frame(f"{Name}_{Sheet}").to_excel(ExcelWriter, sheet_name=Sheet) for Sheet in INTERVAL_SHEETS if f"{Name}_{Sheet}" in Stats]
+
+    with pd.ExcelWriter(os.path.join(directory, f'{prefix}_ICC.xlsx')) as ExcelWriter:
+        Frame("ICC").to_excel(ExcelWriter)
+        Intervals("ICC", ExcelWriter)
+    with pd.ExcelWriter(os.path.join(directory, f'{prefix}_Means.xlsx')) as ExcelWriter:
+        for Sheet in MEANS_SHEETS:
+            Frame(Sheet).to_excel(ExcelWriter, sheet_name=Sheet)
+    with pd.ExcelWriter(os.path.join(directory, f'{prefix}_RC.xlsx')) as ExcelWriter:
+        Frame("RC").to_excel(ExcelWriter)
+        Frame("SEM").to_excel(ExcelWriter, sheet_name="SEM")
+        Intervals("RC", ExcelWriter)
+
+def run(directory=".", replicates=2000, alpha=0.05, seed=None, processes=1):
+    """
+    Compute every statistic of every V1/V2 pair in directory and write them to {directory}/Stats,
+    with (1-alpha) bootstrap intervals of the ICC and RC unless replicates is 0.
+    """
+    for Prefix, (V1File, V2File) in pair_files(directory).items():
+        print(f"{Prefix}: {os.path.basename(V1File)} / {os.path.basename(V2File)}")
+        Tensor, Subjects, Params, Thresholds = load_pair(V1File, V2File)
+        Stats = calc_stats(Tensor)
+        if replicates:
+            Stats.update(bootstrap(Tensor, replicates, alpha, seed, processes))
+        write_stats(Prefix, Stats, Params, Thresholds, os.path.join(directory, "Stats"))
+
+def run_cube(Cube, directory=".", replicates=2000, alpha=0.05, seed=None, processes=1):
+    """Compute the statistics of every method and muscle in a ResultsCube and write them to {directory}/{Method}/Stats/{Muscle}_*.xlsx."""
+    for Method in Cube.labels["method"]:
+        for Muscle in Cube.labels["muscle"]:
+            Tensor, Subjects, Params, Thresholds = load_cube(Cube, Muscle, Method)
+            if len(Subjects) == 0:
+                continue
+            print(f"{Method} {Muscle}: {len(Subjects)} subjects")
+            Stats = calc_stats(Tensor)
+            if replicates:
+                Stats.update(bootstrap(Tensor, replicates, alpha, seed, processes))
+            write_stats(Muscle, Stats, Params, Thresholds, os.path.join(directory, Method, "Stats"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ICC, repeatability and summary statistics of V1/V2 analysis workbooks.")
+    parser.add_argument('directory', nargs='?', default='.', help="directory of the <stem>1.xlsx / <stem>2.xlsx workbooks, or the output directory with --cube")
+    parser.add_argument('--cube', default=None, help="read the results from this ResultsCube instead of workbooks")
+    parser.add_argument('--replicates', type=int, default=2000, help="bootstrap replicates per cell, 0 to skip the intervals")
+    parser.add_argument('--alpha', type=float, default=0.05, help="intervals cover 1-alpha")
+    parser.add_argument('--seed', type=int, default=None, help="seed for reproducible intervals")
+    parser.add_argument('--processes', type=int, default=1, help="bootstrap worker processes (0 for all cores)")
+    args = parser.parse_args(argv)
+    if args.cube is not None:
+        from ResultsCube import ResultsCube
+        run_cube(ResultsCube(args.cube), args.directory, args.replicates, args.alpha, args.seed, args.processes or None)
+    else:
+        run(args.directory, args.replicates, args.alpha, args.seed, args.processes or None)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,8 @@ import plotly.graph_objects as graph
 import matplotlib.pyplot as plt
 import dabest
 from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+from multiprocessing import Pool
 
 DE_CONDITIONS = [
                     "random",
@@ -24,114 +26,195 @@ STR_CONDITIONS = [
 DIR_IN = "N30/MEM-Nov3"                      #### EDIT THIS DEPENDING ON DATASET PROPERTIES
 RAW_IN = "N30/RAW-Nov3"
 DIR_OUT = "N30/ANALYSIS/MEM-Nov3"     #### EDIT THIS DEPENDING ON DATASET PROPERTIES
+STORE_IN = None                         # ScanStore directory to read the ground truths from instead of RAW_IN (ie: "N30/STORE-Nov3")
+PROCESSES = None                        # worker processes for parsing (None uses every core)
+
+KEYS = ["condition", "mu_count", "seed"]
+MEASURES = ["MUNE",
+            "MUNE (% err)",
+            "MUNE (abs % err)",
+            "LSU target (µV)",
+            "LSUE (µV)",
+            "LSUE (abs err, µV)",
+            "MSU target (µV)",
+            "MSUE (µV)",
+            "MSUE (err, µV)",
+            "MSUE (abs err, µV)",
+            "Size MAE (µV)",
+            "Threshold MAE (mA)"]
+UNIT_COLUMNS = ["unit", "target unit", "threshold (mA)", "target threshold (mA)", "size (µV)", "target size (µV)",
+                "threshold err (mA)", "size err (µV)"]
 
 PATHS = []
+for de_condition in DE_CONDITIONS:
+    for re_condition in RE_CONDITIONS:
+        if re_condition == "none":
+                PATHS.append(f"de-{de_condition}/re-{re_condition}/str-0.2")
+                break
+        for str_condition in STR_CONDITIONS:
+            PATHS.append(f"de-{de_condition}/re-{re_condition}/str-{str_condition}")
+
+
+def read_mscanfit(filename):
+    """ Return the MUNE and the MUSE thresholds and sizes (mV) of an MScanFit output MEM file
+            filename - MScanFit output file
+    """
+
+    with open(filename, "r", encoding="latin-1") as file:
+        lines = file.read().splitlines()
+
+    scale = next(float(line.split('=')[1]) / 100 for line in lines if line.startswith("MSFPeakAmp(mV)"))     # MUSEs are given as a % of peak amplitude
+    start = next(index for index, line in enumerate(lines) if line.startswith("!MScan Model"))
+    mune = int(lines[start + 1][1:])
+    values = np.array([line.split('\t')[2:4] for line in lines[start + 2:start + 2 + mune]], dtype=np.float64).reshape(-1, 2)
+    return mune, np.round(values[:, 0], 4), np.round(values[:, 1] * scale, 4)
+
+
+def read_truth(path, mu_count, seed):
+    """ Return the thresholds and sizes (mV) of the ground truth RAW .txt of one scan """
+
+    values = np.loadtxt(f"{RAW_IN}/{path}/mu-{mu_count}/{seed}.txt", delimiter='\t', ndmin=2)
+    return np.round(values[:, 0], 4), np.round(values[:, 1], 4)
+
+
+def match_units(mune_thresholds, mune_sizes, mu_thresholds, mu_sizes):
+    """ Optimally pair MScanFit units with ground truth units by their Euclidean distance in (threshold, size)
+        Returns the indices of the matched MScanFit and ground truth units; with unequal counts the surplus units
+        stay unmatched, as with a square cost matrix padded by a constant.
+    """
+
+    cost = cdist(np.column_stack([mune_thresholds, mune_sizes]), np.column_stack([mu_thresholds, mu_sizes]))
+    return linear_sum_assignment(cost)
+
+
+def ingest_scan(path, filename, truth=None):
+    """ Parse one MScanFit output and its ground truth into a row of per-scan sizes and the matched unit errors;
+        missing values are NaN
+            path - condition path
+            filename - MScanFit output file name, {mu_count}-{seed}.MEM
+            truth - optional (thresholds, sizes) ground truth, read from RAW_IN when not given
+    """
+
+    mu_count, seed = (int(x) for x in filename[:-len(".MEM")].split('-'))
+    row = {"condition": path, "mu_count": mu_count, "seed": seed}
+    units = np.empty((0, len(UNIT_COLUMNS)))
+    try:
+        mune, mune_thresholds, mune_sizes = read_mscanfit(f"{DIR_IN}/{path}/{filename}")
+        mu_thresholds, mu_sizes = truth if truth is not None else read_truth(path, mu_count, seed)
+        row.update({"MUNE": mune,
+                    "LSU target (µV)": np.max(mu_sizes) * 1000,
+                    "LSUE (µV)": np.max(mune_sizes) * 1000,
+                    "MSU target (µV)": np.mean(mu_sizes) * 1000,
+                    "MSUE (µV)": np.mean(mune_sizes) * 1000})
+
+        unit, target = match_units(mune_thresholds, mune_sizes, mu_thresholds, mu_sizes)
+        units = np.column_stack([unit + 1, target + 1,
+                                 mune_thresholds[unit], mu_thresholds[target],
+                                 mune_sizes[unit] * 1000, mu_sizes[target] * 1000,
+                                 mune_thresholds[unit] - mu_thresholds[target],
+                                 (mune_sizes[unit] - mu_sizes[target]) * 1000])
+        row.update({"Size MAE (µV)": np.mean(np.abs(units[:, -1])),
+                    "Threshold MAE (mA)": np.mean(np.abs(units[:, -2]))})
+    except (OSError, ValueError, IndexError, StopIteration):
+        print(f"missing values: {path}/{mu_count}-{seed}")
+    return row, units
+
+
+def _ingest(task):
+    return ingest_scan(*task)
+
 
-def main():
-    for de_condition in DE_CONDITIONS:
-        for re_condition in RE_CONDITIONS:
-            if re_condition == "none":
-                    PATHS.append(f"de-{de_condition}/re-{re_condition}/str-0.2")
-                    break
-            for str_condition in STR_CONDITIONS:
-                PATHS.append(f"de-{de_condition}/re-{re_condition}/str-{str_condition}")
-
-    measures = ["MUNE",
-                "MUNE (% err)",
-                "MUNE (abs % err)",
-                "LSU target (µV)",
-                "LSUE (µV)",
-                "LSUE (abs err, µV)",
-                "MSU target (µV)",
-                "MSUE (µV)",
-                # ADD MSUE ERROR
-                "MSUE (abs err, µV)"]
-    aggregate = {measure: {} for measure in measures}
-
-    for path in PATHS:
-        data = {}
-        for filename in os.listdir(f"{DIR_IN}/{path}"):
+def ingest(paths, processes=PROCESSES, store=None):
+    """ Parse and unit-match every MScanFit output of the condition paths in parallel
+        Returns the long table of scans, one row per scan, and the table of matched units, one row per unit pair
+            paths - condition paths under DIR_IN
+            processes - number of worker processes (None uses every core)
+            store - optional ScanStore to read the ground truths from instead of RAW_IN
+    """
+
+    truths = {}
+    if store is not None:
+        for entry, scan in store.select(condition=paths):
+            truths[(str(entry["condition"]), int(entry["mu_count"]), int(entry["seed"]))] = (np.round(scan["thresholds"], 4), np.round(scan["sizes"], 4))
+
+    tasks = []
+    for path in paths:
+        for filename in sorted(os.listdir(f"{DIR_IN}/{path}")):
             if filename.endswith("MEM"):                                            # find MScanFit output file
-                [mu_count, iteration] = filename.strip(".MEM").split('-')           # gather some filename variables for later
-                mu_count = int(mu_count)
-                data.setdefault(mu_count, {measure: [] for measure in measures})    # initialize a column to store data for this MU count
-
-                start = None            # will store index after which the relevant data is stored in the file
-                mune = None             # will store the MScanFit MUNE
-                mune_thresholds = []
-                mune_sizes = []         # will store the MScanFit MUSEs (Motor Unit Size Estimates)
-                mune_scale = None       # will store the scale factor for MUSEs, since outputs are given as a % of peak amplitude
-                mu_thresholds = []
-                mu_sizes = []           # will store the actual MU sizes
-
-                with open(f"{DIR_IN}/{path}/{filename}", 'r') as file:
-                    for index, line in enumerate(file):
-                        if line.startswith("MSFPeakAmp(mV)"):
-                            mune_scale = float(line.split('=')[1]) / 100                        # get the MUSE scale factor
-                        if line.startswith("!MScan Model"):
-                            start = index                                                       # get the start index
-                        if start:
-                            if index == start + 1:
-                                mune = int(line[1:])                                            # get the MUNE
-                            elif index > start and index <= start + mune + 1:
-                                values = line.split('\t')
-                                mune_thresholds.append(round(float(values[2]), 4))
-                                mune_sizes.append(round(float(values[3]) * mune_scale, 4))      # get the MUSEs
-
-                with open(f"{RAW_IN}/{path}/mu-{mu_count}/{iteration}.txt", 'r') as file:
-                    for line in file:
-                        mu_thresholds.append(round(float(line.split('\t')[0]), 4))
-                        mu_sizes.append(round(float(line.split('\t')[1]), 4))      # get the actual MU sizes from the RAW data (ground truth)
-
-                try:
-                    data[mu_count]["MUNE"].append(mune)
-                    data[mu_count]["MUNE (% err)"].append((mune - mu_count) / mu_count * 100)
-                    data[mu_count]["MUNE (abs % err)"].append(abs(mune - mu_count) / mu_count * 100)
-                    data[mu_count]["LSU target (µV)"].append(np.max(mu_sizes) * 1000)
-                    data[mu_count]["LSUE (µV)"].append(np.max(mune_sizes) * 1000)
-                    data[mu_count]["LSUE (abs err, µV)"].append(abs(np.max(mune_sizes) - np.max(mu_sizes)) * 1000)
-                    data[mu_count]["MSU target (µV)"].append(np.mean(mu_sizes) * 1000)
-                    data[mu_count]["MSUE (µV)"].append(np.mean(mune_sizes) * 1000)
-                    data[mu_count]["MSUE (abs err, µV)"].append(abs(np.mean(mune_sizes) - np.mean(mu_sizes)) * 1000)
-                    
-                    for measure in aggregate:
-                        aggregate[measure].setdefault(path, [])     # initialize a column to store data for this condition
-                    aggregate["MUNE"][path].append({mu_count: mune})
-                    aggregate["MUNE (% err)"][path].append({mu_count: (mune - mu_count) / mu_count * 100})
-                    aggregate["MUNE (abs % err)"][path].append({mu_count: abs(mune - mu_count) / mu_count * 100})
-                    aggregate["LSU target (µV)"][path].append({mu_count: np.max(mu_sizes) * 1000})
-                    aggregate["LSUE (µV)"][path].append({mu_count: np.max(mune_sizes) * 1000})
-                    aggregate["LSUE (abs err, µV)"][path].append({mu_count: abs(np.max(mune_sizes) - np.max(mu_sizes)) * 1000})
-                    aggregate["MSU target (µV)"][path].append({mu_count: np.mean(mu_sizes) * 1000})
-                    aggregate["MSUE (µV)"][path].append({mu_count: np.mean(mune_sizes) * 1000})
-                    # ADD MSUE ERROR
-                    aggregate["MSUE (abs err, µV)"][path].append({mu_count: abs(np.mean(mune_sizes) - np.mean(mu_sizes)) * 1000})
-                except:
-                    print(f"missing values: {path}/{mu_count}-{iteration}")
-
-                # # Plot stuff
-                # directory = f"{DIR_OUT}/{path}/mu-{mu_count}"
-                # os.makedirs(directory, exist_ok=True)
-                # fig = graph.Figure()
-                # fig.update_layout(title=f"MUNE={mune}-{sum(mune_sizes)} | RAW={mu_count}-{sum(mu_sizes)}", xaxis_title="Motor Unit",  yaxis_title="Amplitude (mV)")
-                # fig.add_trace(graph.Scatter(x=list(range(1,len(mune_sizes)+1)), y=sorted(mune_sizes), mode="markers", name="MUNE"))
-                # fig.add_trace(graph.Scatter(x=list(range(1,len(mu_sizes)+1)),y=sorted(mu_sizes), mode="markers", name = "RAW"))
-                # fig.write_image(f"{directory}/{iteration}.png")
-
-                # analyze_size(directory, iteration, mune, mu_count, mune_thresholds, mune_sizes, mu_thresholds, mu_sizes)
-
-        try:
-            df = pd.DataFrame(data)                                                 # convert the data dictionary to a readable dataframe
-            for col in df.columns:
-                for i, row in enumerate(df[col]):
-                    df[col].iloc[i] = f"{np.mean(row):.2f} ± {np.std(row):.2f}"     # collapse iteration dimension into mean ± SD
-            df = df.reindex(sorted(df.columns, key=int), axis=1)                    # sort the column heading MU counts
-            df["Combined"] = df.apply(lambda row: f"{np.mean([float(x.split(' ± ')[0]) for x in row]):.2f} ± {np.std([float(x.split(' ± ')[0]) for x in row]):.2f}", axis=1)
-            os.makedirs(f"{DIR_OUT}/{path}", exist_ok=True)
-            df.to_csv(f"{DIR_OUT}/{path}/summary.csv", index=True)
-            print(f"{DIR_OUT}/{path}/summary.csv")
-        except:
+                mu_count, seed = (int(x) for x in filename[:-len(".MEM")].split('-'))
+                tasks.append((path, filename, truths.get((path, mu_count, seed))))
+
+    with Pool(processes) as pool:
+        results = pool.map(_ingest, tasks, chunksize=max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1))))
+    rows = [row for row, _ in results]
+
+    table = pd.DataFrame(rows, columns=KEYS + ["MUNE", "LSU target (µV)", "LSUE (µV)", "MSU target (µV)", "MSUE (µV)", "Size MAE (µV)", "Threshold MAE (mA)"])
+    units = pd.DataFrame(np.concatenate([units for _, units in results]) if results else np.empty((0, len(UNIT_COLUMNS))), columns=UNIT_COLUMNS)
+    counts = [len(units) for _, units in results]
+    for key in KEYS:
+        units.insert(KEYS.index(key), key, np.repeat([row[key] for row in rows], counts))
+    units[["unit", "target unit"]] = units[["unit", "target unit"]].astype(int)
+    return add_measures(table), units
+
+
+def add_measures(table):
+    """ Add every error measure as a column operation over the whole table """
+
+    mune, mu_count = table["MUNE"], table["mu_count"]
+    table["MUNE (% err)"] = (mune - mu_count) / mu_count * 100
+    table["MUNE (abs % err)"] = table["MUNE (% err)"].abs()
+    table["LSUE (abs err, µV)"] = (table["LSUE (µV)"] - table["LSU target (µV)"]).abs()
+    table["MSUE (err, µV)"] = table["MSUE (µV)"] - table["MSU target (µV)"]
+    table["MSUE (abs err, µV)"] = table["MSUE (err, µV)"].abs()
+    return table[KEYS + MEASURES]
+
+
+def summarize(table):
+    """ Return {condition: summary} with the mean ± SD of every measure (rows) per MU count (columns) and Combined,
+        the mean ± SD over MU counts of those means; all from one grouped aggregation
+    """
+
+    complete = table.dropna(subset=MEASURES)                                # scans with missing values are left out, as before
+    long = complete.melt(id_vars=KEYS, value_vars=MEASURES, var_name="measure")
+    stats = long.groupby(["condition", "measure", "mu_count"], sort=False)["value"].agg(mean="mean", sd=lambda x: x.std(ddof=0))
+    combined = stats["mean"].groupby(level=["condition", "measure"], sort=False).agg(mean="mean", sd=lambda x: x.std(ddof=0))
+
+    cells = stats["mean"].map("{:.2f}".format) + " ± " + stats["sd"].map("{:.2f}".format)
+    combined = combined["mean"].map("{:.2f}".format) + " ± " + combined["sd"].map("{:.2f}".format)
+
+    summaries = {}
+    for condition, group in cells.groupby(level="condition", sort=False):
+        summary = group.droplevel("condition").unstack("mu_count")
+        summary = summary.reindex(index=MEASURES, columns=sorted(summary.columns))
+        summary["Combined"] = combined[condition].reindex(MEASURES)
+        summaries[condition] = summary
+    return summaries
+
+
+def main(paths=PATHS, processes=PROCESSES):
+    store = None
+    if STORE_IN is not None:
+        from Store import ScanStore
+        store = ScanStore(STORE_IN)
+
+    table, units = ingest(paths, processes, store)
+    os.makedirs(DIR_OUT, exist_ok=True)
+    table.to_csv(f"{DIR_OUT}/scans.csv", index=False)                   # long table of every scan and measure
+    units.to_csv(f"{DIR_OUT}/units.csv", index=False)                   # every matched MScanFit and ground truth unit pair
+    print(f"{DIR_OUT}/scans.csv")
+
+    summaries = summarize(table)
+    for path in paths:
+        if path not in summaries:
             print(f"summary not created: {path}")
+            continue
+        os.makedirs(f"{DIR_OUT}/{path}", exist_ok=True)
+        summaries[path].to_csv(f"{DIR_OUT}/{path}/summary.csv", index=True)
+        print(f"{DIR_OUT}/{path}/summary.csv")
+
+        # MUNE per model individual (rows) and MU count (columns), as read by SDC.py
+        mune = table[table["condition"] == path].pivot(index="seed", columns="mu_count", values="MUNE")
+        mune.sort_index(axis=1).to_csv(f"{DIR_OUT}/{path}/MUNE.csv")
 
     # for measure in measures:
     #     # aggregate[measure]["de-random/re-selective/str-0.2"].append({5: None})
@@ -174,78 +257,5 @@ def main():
     #         plt.savefig(f"{DIR_OUT}/{col}/{measure}.png")
     #         print(f"{DIR_OUT}/{col}/{measure}.png")
 
-# def euclid(x1, y1, x2, y2):
-#     length = max([len(x1), len(x2)])
-#     matrix = []
-#     for i in range(length):
-#         matrix.append([])
-#         for j in range(length):
-#             try:
-#                 matrix[i].append(np.sqrt((x1[i]-x2[j])**2 + (y1[i]-y2[j])**2))
-#             except:
-#                 matrix[i].append(100)
-#     return matrix
-
-# def hungarian(matrix):
-#     matrix = np.array(matrix)
-#     row, col = linear_sum_assignment(matrix)
-#     cost = matrix[row, col].sum()
-#     return row, col, cost
-
-# def analyze_size(directory, iteration, mune, mu_count, mune_thresholds, mune_sizes, mu_thresholds, mu_sizes):
-
-#     #Plot stuff
-#     fig = graph.Figure()
-#     fig.update_layout(title=f"MUNE={mune}-{sum(mune_sizes)} | GROUND TRUTH={mu_count}-{sum(mu_sizes)}", xaxis_title="Threshold Mean (mA)",  yaxis_title="Amplitude (mV)")
-#     fig.add_trace(graph.Scatter(x=mune_thresholds, y=mune_sizes, mode="markers", name="MUNE"))
-#     fig.add_trace(graph.Scatter(x=mu_thresholds,y=mu_sizes, mode="markers", name = "GROUND TRUTH"))
-#     fig.write_image(f"{directory}/{iteration}-unsorted.png")
-
-#     length = max([len(mune_thresholds), len(mu_thresholds)])
-#     matrix = []
-#     for i in range(length):
-#         matrix.append([])
-#         for j in range(length):
-#             try:
-#                 matrix[i].append(np.sqrt((mune_thresholds[i]-mu_thresholds[j])**2 + (mune_sizes[i]-mu_sizes[j])**2))
-#             except:
-#                 matrix[i].append(100)
-
-#     matrix = np.array(matrix)
-#     row, col = linear_sum_assignment(matrix)
-#     cost = matrix[row, col].sum()
-
-#     matrix = euclid(mune_thresholds, mune_sizes, mu_thresholds, mu_sizes)
-#     row, col, cost = hungarian(matrix)
-#     # test = []
-#     for i in range(len(row)):
-#         print(f"Row {row[i]} matched to column {col[i]}")
-#         print(f"minimum cost: {cost}")
-#         ## test.append([mune_thresholds[row[i]], mune_sizes[row[i]], mu_thresholds[col[i]], mu_sizes[col[i]]])
-    
-#     with open(f"{directory}/{iteration}.txt", 'w') as file:
-#         file.write(f"MUNE size mean: {np.mean(mune_sizes)}\n")
-#         file.write(f"MU size mean: {np.mean(mu_sizes)}\n")
-
-#         abs_diff = []
-#         for i in range(length):
-#             row_i = row[i]
-#             col_i = col[i]
-
-#             if len(mune_thresholds) < length:
-#                 mune_unit = f"MUNE unit {row_i + 1}" if row_i < len(mune_thresholds) else "Dummy unit"
-#                 mu_unit = f"Real unit {col_i + 1}"
-#             elif len(mu_thresholds) < length:
-#                 mune_unit = f"MUNE unit {row_i + 1}"
-#                 mu_unit = f"Real unit {col_i + 1}" if col_i < len(mu_thresholds) else "Dummy unit"
-#             else:
-#                 mune_unit = f"MUNE unit {row_i + 1}"
-#                 mu_unit = f"Real unit {col_i + 1}"
-#             file.write(f"{mune_unit} <-> {mu_unit}\n")
-
-#             if mune_unit != "Dummy unit" and mu_unit != "Dummy unit":
-#                 abs_diff.append(abs(mune_sizes[row_i] - mu_sizes[col_i]))
-#         mae = np.mean(abs_diff)
-#         file.write(f"Mean absolute error: {mae}\n")
-
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
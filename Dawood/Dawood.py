@@ -4,9 +4,11 @@
 """
 
 import numpy as np
-from scipy.stats import expon
 from scipy.special import erf
 from Export import *
+from MotorPool import MotorPool
+from Sweep import sweep
+from Store import ScanStore
 
 # SIMULATION PARAMETERS
 SEEDS = list(range(1,31))           # seeds for pseudo-random reproducability, one per model individual
@@ -27,6 +29,11 @@ VULNERABILITY = 0.5                 # vulnerability represents the fraction of u
 SAMPLES = 500                       # length of simulation (nsamples)
 FLANKS = 20                         # length of pre-scan and post-scan limit region
 NOISE = 0.01                        # additive noise deviation
+PROCESSES = None                    # worker processes for the sweep (None uses every core)
+MANIFEST = f"{PRE_PATH}{STORE_PATH}/sweep.manifest"    # checkpoint of completed (condition, seed) trajectories
+CHECKPOINT = 100                    # trajectories written to the store as one shard and checkpointed together
+EXPORTS = ["MEM", "TXT"]            # per-scan files exported from the scan store after the sweep ([] keeps only the store)
+EXPORT_MANIFEST = f"{PRE_PATH}{STORE_PATH}/export.manifest"     # checkpoint of store shards already exported
 
 # MOTOR POOL PARAMETERS
 MU_COUNT = 160                  # number of motor units in the initial pool
@@ -38,45 +45,71 @@ THRESHOLD_SPREAD = 0.0165       # relative spread of threshold
 
 
 def main():
+    streams = np.random.SeedSequence(SEEDS).spawn(len(SEEDS))      # one independent seed stream per model individual, shared by every condition
+    tasks = {}                                                      # every (condition, individual) trajectory is an independent task
+
     for de_method in DE_METHODS:
         for re_method in RE_METHODS:
             for resilience in RESILIENCE:
                 gen_path = f"de-{de_method}/re-{re_method}/str-{resilience}"    # generic path to store files
-                mef_paths = []                                                  # will store the MEM files that wil be referenced in the MEF index
-
                 for i in range(len(SEEDS)):
-                    rng = np.random.default_rng(seed=SEEDS[i])                                                          # set the seed of the rng for reproducability
-                    mu_sizes = expon.rvs(scale=SMUP_MEAN-SMUP_MIN, loc=SMUP_MIN, size=MU_COUNT, random_state=rng)       # intialize the healthy motor pool with  given mean amplitude
-                    mu_thresholds = rng.normal(THRESHOLD_MEAN, THRESHOLD_DEV, len(mu_sizes))                            # produce a normal distribution of motor unit thresholds
-                    mu_devs = mu_thresholds * THRESHOLD_SPREAD                                                          # calculate deviations for each motor unit threshold
-                    mu_dict = list(zip(mu_sizes, mu_thresholds, mu_devs))                                               # zip motor unit properties to facilitate synced remodeling
-                    mu_counts = []                                                                                      # keep track of motor pool sizes for trajectories
-                    max_cmaps = []                                                                                      # keep track of maximal CMAP for trajectories
-
-                    while len(mu_dict) >= 5:
-                        mu_sizes, mu_thresholds, mu_devs = [np.array(x) for x in zip(*mu_dict)]     # unzip motor unit properties for easier scanning
-                        mu_count = len(mu_dict)
-                        mu_counts.append(mu_count)
-
-                        stimuli, responses = scan(mu_sizes, mu_thresholds, mu_devs, rng)            # generate the (stimulus,response) data for the scan
-                        # generatePlot(f"{gen_path}/mu-{mu_count}", i+1 , stimuli, responses)         # plot and save the (stimulus,response) data from the scan in /PLOTS
-                        generateMEM(gen_path, f"{mu_count}-{i+1}", stimuli, responses)              # export scan data to MScanFit-compatible .MEM file in /MEM
-                        generateTXT(f"{gen_path}/mu-{mu_count}", i+1, mu_thresholds, mu_sizes)      # export motor unit threshold, size ground truths to .txt file in /RAW
-                        # generateDist(f"{gen_path}/mu-{mu_count}", i+1, mu_sizes)                    # plot frequency distribution for the SMUPs
-                        # mef_paths.append(f"{mu_count}-{i+1}")                                       # keep track of the MEM filenames for the MEF index
-                        # max_cmaps.append(max(responses))                                            # store the maximal CMAP response for the trajectories
-
-                        mu_dict = degenerate(mu_dict, de_method, re_method, resilience, rng)     # handle degeneration and reinnervation of motor units
-
-                    # generateTrajectory(f"{gen_path}/mu-{mu_count}", i+1, mu_counts, max_cmaps)      # generate trajectory based on change in maximal CMAP over degeneration progress
-
-                    re_str = resilience*100 if re_method != "none" else "0.0"                                                                       # string helper for progress bar                           
-                    print_progress(i+1, len(SEEDS), f"Running '{de_method}' denervation and {re_str}% '{re_method}' reinnervation", '', 0, 50)      # display progress bar
-                
-                # generateMEF(gen_path, mef_paths)    # create the MEF index for all MEM files produced in the given condition
+                    tasks[f"{gen_path}/{i+1}"] = (gen_path, de_method, re_method, resilience, i+1, streams[i])
 
                 if re_method == "none":
-                    break   # break unnecessary loop of varying reinnervation strengths when there is no compensation 
+                    break   # break unnecessary loop of varying reinnervation strengths when there is no compensation
+
+    store = ScanStore(f"{PRE_PATH}{STORE_PATH}")                   # columnar store holding every scan and its ground truths
+
+    def collect(key, scans, done, total):
+        gen_path, seed = key.rsplit("/", 1)
+        for mu_count, stimuli, responses, thresholds, sizes in scans:
+            store.append(gen_path, int(seed), mu_count, stimuli, responses, thresholds, sizes)
+        print_progress(done, total, "Running degeneration sweep", '', 0, 50)                # display progress bar
+
+    sweep(trajectory, tasks, MANIFEST, PROCESSES, collect, store.flush, CHECKPOINT)    # trajectories are checkpointed once flushed, so a rerun resumes the sweep
+
+    if EXPORTS:                                                     # write MScanFit-compatible files only when they are needed
+        shards = {f"shard-{shard}": (store.path, EXPORTS, int(shard)) for shard in store.shards()}
+        sweep(export_shard, shards, EXPORT_MANIFEST, PROCESSES)     # shards exported by an earlier run are skipped
+
+
+def export_shard(store_path, formats, shard):
+    """ Export the scans of one store shard to per-scan files """
+
+    exportScans(ScanStore(store_path), formats, shards=[shard])
+
+
+def trajectory(gen_path, de_method, re_method, resilience, iteration, stream):
+    """ Degenerate one model individual under one condition, scanning the pool at every step
+            gen_path - generic path of the condition to store files in
+            de_method, re_method, resilience - degeneration and reinnervation condition
+            iteration - 1-based index of the model individual, used in the filenames
+            stream - numpy SeedSequence of this individual, so the result is independent of scheduling
+
+        Returns a list of (mu_count, stimuli, responses, thresholds, sizes), one per scan.
+    """
+
+    rng = np.random.default_rng(stream)                                                                             # seed the rng from the individual's stream for reproducability
+    pool = MotorPool.healthy(MU_COUNT, SMUP_MEAN, SMUP_MIN, THRESHOLD_MEAN, THRESHOLD_DEV, THRESHOLD_SPREAD, rng)    # intialize the healthy motor pool with given mean amplitude
+    scans = []                                                                                                      # keep the scans and ground truths of every step
+    mu_counts = []                                                                                                  # keep track of motor pool sizes for trajectories
+    max_cmaps = []                                                                                                  # keep track of maximal CMAP for trajectories
+
+    while len(pool) >= 5:
+        mu_count = len(pool)
+        mu_counts.append(mu_count)
+
+        stimuli, responses = scan(pool.sizes, pool.thresholds, pool.devs, rng)                          # generate the (stimulus,response) data for the scan
+        # generatePlot(f"{gen_path}/mu-{mu_count}", iteration, stimuli, responses)                        # plot and save the (stimulus,response) data from the scan in /PLOTS
+        scans.append((mu_count, stimuli, responses, pool.thresholds.copy(), pool.sizes.copy()))       # scan data and motor unit threshold, size ground truths for the store
+        # generateDist(f"{gen_path}/mu-{mu_count}", iteration, pool.sizes)                                # plot frequency distribution for the SMUPs
+        # max_cmaps.append(max(responses))                                                                # store the maximal CMAP response for the trajectories
+
+        pool.degenerate(de_method, re_method, resilience, VULNERABILITY, rng)                           # handle degeneration and reinnervation of motor units
+
+    # generateTrajectory(f"{gen_path}/mu-{mu_count}", iteration, mu_counts, max_cmaps)      # generate trajectory based on change in maximal CMAP over degeneration progress
+
+    return scans
 
 
 def scan(mu_sizes, mu_thresholds, mu_devs, rng):
@@ -102,41 +135,6 @@ def scan(mu_sizes, mu_thresholds, mu_devs, rng):
     return stimuli, responses
 
 
-def degenerate(mu_dict, de_method, re_method, resilience, rng):
-    """ Handle the degeneration and reinnervation of motor units """
-
-    if de_method == "random":
-        de_dict = [tuple(x) for x in rng.choice(mu_dict, size=int(len(mu_dict)*VULNERABILITY), replace=False)]      # randomly select X% of the motor units to degenerate
-
-    elif de_method == "selective":
-        mu_dict = sorted(mu_dict, key=lambda x: x[0])               # sort the motor units by size
-        de_dict = mu_dict[int(len(mu_dict) * VULNERABILITY):]       # denervate the largest motor units
-
-    mu_dict = list(set(mu_dict) - set(de_dict))                             # remove these degenerated units from the modeled units
-    mu_sizes, mu_thresholds, mu_devs = [list(x) for x in zip(*mu_dict)]     # unzip remaining motor unit properties to facilitate reinnervation calculations
-    de_sizes, de_thresholds, de_devs = [list(x) for x in zip(*de_dict)]     # unzip denervated motor unit properties to facilitate reinnervation calculations
-    
-    if re_method == "random":
-        re_sizes = rng.choice(de_sizes, size=int(len(de_sizes)*resilience), replace=False)                          # randomly select some % of the degenerated units to reinnervate           
-        re_indices = rng.choice(list(range(len(mu_sizes))), size=int(len(de_sizes)*resilience), replace=False)      # randomly select some % of the remaining units to compensate
-        for i in range(len(re_sizes)):                                                                                       
-            mu_sizes[re_indices[i]] += re_sizes[i]                                                                  # compensate remaining motor units
-
-    elif re_method == "distributive":                                 
-            re_amplitude = sum(de_sizes) * resilience / len(mu_sizes)       # calculate equal fraction of total CMAP attributable to denervated units
-            for i in range(len(mu_sizes)):
-                mu_sizes[i] += re_amplitude                                 # compensate each motor unit equally
-
-    elif re_method == "selective":
-            de_sum = sum(de_sizes)                                                      # total CMAP response attributable to denervated units 
-            mu_squares = np.square(mu_sizes)                                            # square motor unit sizes to get a more exponential distribution
-            mu_square_sum = np.sum(mu_squares)
-            for i in range(len(mu_sizes)):          
-                mu_sizes[i] += (mu_squares[i] / mu_square_sum * de_sum * resilience)    # compensate the largest remaining motor units by the largest amount
-
-    return list(zip(mu_sizes, mu_thresholds, mu_devs))      # rezip motor unit properties to facilitate synced remodeling again
-
-
 def print_progress (iteration, total, prefix = '', suffix = '', decimals = 1, length = 100, fill = '█', printEnd = "\r"):
     # https://stackoverflow.com/questions/3173320/text-progress-bar-in-terminal-with-block-characters
     percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
@@ -173,4 +171,5 @@ def plot_activation_curves(stimuli, mu_thresholds, mu_devs):
     ax.grid(True, linestyle='--', alpha=0.6)
     plt.show()
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -5,6 +5,7 @@ import matplotlib.pyplot as plt
 
 PRE_PATH = 'N30/'   # end with '/' if not empty
 MEM_PATH = "MEM-Oct24"
+STORE_PATH = "STORE-Oct24"
 
 def generateDAT(path, filename, stimuli, responses):
     """ Export stimulus-response data from simulation to MScanFit-compatible .DAT file
@@ -17,21 +18,19 @@ def generateDAT(path, filename, stimuli, responses):
     directory = f"{PRE_PATH}DAT/{path}"                   # set an appropriate path for the data
     os.makedirs(directory, exist_ok=True)       # ensure all intermediate directories are created
 
+    lines = [f"{stimulus:<30} {response}\r\n" for stimulus, response in zip(stimuli, responses)]     # \r\n is the MScanFit-compatible (Windows) newline character
     with open(f"{directory}/{filename}.DAT", "w") as file:
-        for stimulus, response in zip(stimuli, responses):      # zip() function pairs elements from both arrays into tuples
-            file.write(f"{stimulus:<30} {response}\r\n")        # \r\n is the MScanFit-compatible (Windows) newline character
+        file.write("".join(lines))                              # one buffered write per file
 
 
 def generateMEM(path, filename, stimuli, responses):
     directory = f"{PRE_PATH}{MEM_PATH}/{path}"
     os.makedirs(directory, exist_ok=True)
 
+    lines = ["Scanpts: 1, 20, 521, 540\r\n"]         # indicates the pre-scan and post-scan limits, these work for our scan of 450
+    lines += [f"MS.{i:<8}{stimulus:<30} {response}\r\n" for i, (stimulus, response) in enumerate(zip(stimuli, responses), 1)]
     with open(f"{directory}/{filename}.MEM", "w") as file:
-        file.write("Scanpts: 1, 20, 521, 540\r\n")      # indicates the pre-scan and post-scan limits, these work for our scan of 450
-        i = 0
-        for stimulus, response in zip(stimuli, responses):
-            i += 1
-            file.write(f"MS.{i:<8}{stimulus:<30} {response}\r\n")
+        file.write("".join(lines))
 
 
 def generateMEF(path, filenames):
@@ -47,9 +46,27 @@ def generateTXT(path, filename, thresholds, sizes):
     directory = f"{PRE_PATH}RAW/{path}"
     os.makedirs(directory, exist_ok=True)
 
+    lines = [f"{threshold}\t{size}\n" for threshold, size in zip(thresholds, sizes)]
     with open(f"{directory}/{filename}.txt", "w") as file:
-        for i in range(len(thresholds)):      
-            file.write(f"{thresholds[i]}\t{sizes[i]}\n")
+        file.write("".join(lines))
+
+
+def exportScans(store, formats=("MEM", "TXT"), condition=None, shards=None):
+    """ Bulk export scans from a ScanStore to the per-scan files expected by MScanFit and the analysis scripts
+            store - ScanStore holding the simulated scans
+            formats - any of "MEM", "DAT" (stimulus-response data) and "TXT" (threshold, size ground truths)
+            condition - optional condition path (or list of paths) to restrict the export to
+            shards - optional shard numbers to restrict the export to, ie: the shards written since the last export
+    """
+
+    for entry, scan in store.select(condition=condition, shard=shards):
+        path, seed, mu_count = str(entry["condition"]), int(entry["seed"]), int(entry["mu_count"])
+        if "MEM" in formats:
+            generateMEM(path, f"{mu_count}-{seed}", scan["stimuli"], scan["responses"])
+        if "DAT" in formats:
+            generateDAT(f"{path}/mu-{mu_count}", seed, scan["stimuli"], scan["responses"])
+        if "TXT" in formats:
+            generateTXT(f"{path}/mu-{mu_count}", seed, scan["thresholds"], scan["sizes"])
 
 
 def generatePlot(path, filename, stimuli, responses):
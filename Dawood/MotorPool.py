@@ -0,0 +1,77 @@
+"""
+    Structure-of-arrays motor pool used by the degeneration study. Motor unit i is described by
+    (sizes[i], thresholds[i], devs[i]); the three arrays are kept contiguous and in sync, so
+    degeneration and reinnervation are index and mask operations instead of tuple churn.
+"""
+
+import numpy as np
+from scipy.stats import expon
+
+
+class MotorPool:
+
+    def __init__(self, sizes, thresholds, devs):
+        self.sizes = np.ascontiguousarray(sizes, dtype=np.float64)              # single motor unit potential amplitudes (mV)
+        self.thresholds = np.ascontiguousarray(thresholds, dtype=np.float64)    # activation thresholds (mA)
+        self.devs = np.ascontiguousarray(devs, dtype=np.float64)                # activation threshold deviations (mA)
+
+    @classmethod
+    def healthy(cls, count, smup_mean, smup_min, threshold_mean, threshold_dev, threshold_spread, rng):
+        """ Initialize a healthy motor pool, drawing from rng in the same order as the original tuple-based model """
+
+        sizes = expon.rvs(scale=smup_mean-smup_min, loc=smup_min, size=count, random_state=rng)     # exponential distribution of motor unit sizes
+        thresholds = rng.normal(threshold_mean, threshold_dev, count)                               # normal distribution of motor unit thresholds
+        devs = thresholds * threshold_spread                                                        # deviations relative to each threshold
+        return cls(sizes, thresholds, devs)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def degenerate(self, de_method, re_method, resilience, vulnerability, rng):
+        """ Handle the degeneration and reinnervation of motor units in place
+
+            de_method - "random" or "selective" (largest units) denervation
+            re_method - "random", "distributive", "selective" or "none" reinnervation
+            resilience - fraction of the denervated amplitude that is compensated for
+            vulnerability - fraction of the motor units denervated per step
+            rng - numpy Generator driving the random choices
+
+            Surviving units keep their relative order, so a given rng state always produces the same pool.
+        """
+
+        count = len(self)
+
+        if de_method == "random":
+            de_count = int(count * vulnerability)
+            de_indices = rng.choice(count, size=de_count, replace=False)           # randomly select X% of the motor units to degenerate
+        elif de_method == "selective":
+            keep_count = int(count * vulnerability)                                 # the smallest X% of the motor units survive
+            de_indices = np.argsort(self.sizes, kind="stable")[keep_count:]         # denervate the largest motor units
+        else:
+            raise ValueError(f"Unknown denervation method '{de_method}'")
+
+        keep = np.ones(count, dtype=bool)
+        keep[de_indices] = False
+        de_sizes = self.sizes[de_indices]                                           # denervated amplitudes, in selection order
+
+        self.sizes = self.sizes[keep]                                               # remove the degenerated units from the modeled units
+        self.thresholds = self.thresholds[keep]
+        self.devs = self.devs[keep]
+
+        if re_method == "random":
+            re_count = int(len(de_sizes) * resilience)
+            re_sizes = rng.choice(de_sizes, size=re_count, replace=False)           # randomly select some % of the degenerated units to reinnervate
+            re_indices = rng.choice(len(self), size=re_count, replace=False)        # randomly select some % of the remaining units to compensate
+            self.sizes[re_indices] += re_sizes                                      # indices are unique, so a fancy-indexed add is exact
+
+        elif re_method == "distributive":
+            self.sizes += np.sum(de_sizes) * resilience / len(self)                 # compensate each motor unit equally
+
+        elif re_method == "selective":
+            mu_squares = np.square(self.sizes)                                      # square motor unit sizes to get a more exponential distribution
+            self.sizes += mu_squares / np.sum(mu_squares) * np.sum(de_sizes) * resilience     # compensate the largest remaining motor units by the largest amount
+
+        elif re_method != "none":
+            raise ValueError(f"Unknown reinnervation method '{re_method}'")
+
+        return self
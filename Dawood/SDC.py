@@ -30,78 +30,68 @@ for de_condition in DE_CONDITIONS:
         for str_condition in STR_CONDITIONS:
             PATHS.append(f"de-{de_condition}/re-{re_condition}/str-{str_condition}")
 
+STATISTICS = ["SD", "COV", "SDC", "SDCP", "SEM", "SEMP"]      # also the stems of the legacy {stat}pyMUNE.csv files
+
+
+def load(paths):
+    """ Load the MUNE.csv of every condition path into one (condition x mu_count x seed) array, NaN where missing
+        Returns the array, the MU counts and the seeds
+    """
+
+    tables = [pd.read_csv(f"{DIR_IN}/{path}/MUNE.csv", index_col=0) for path in paths]
+    mu_counts = sorted({int(column) for table in tables for column in table.columns})
+    seeds = sorted({seed for table in tables for seed in table.index})
+    mune = np.stack([table.rename(columns=int).reindex(index=seeds, columns=mu_counts).to_numpy(dtype=np.float64).T for table in tables])
+    return mune, mu_counts, seeds
+
+
+def summarize(mune):
+    """ Return the reliability statistics over seeds of every (condition, mu_count) cell as a dict of arrays
+            SD - sample standard deviation (ddof=1)
+            COV - SD / mean
+            SDC - smallest detectable change, SD * sqrt(2) * 1.96
+            SDCP - SDC / mean
+            SEM - standard error of the mean, SD / sqrt(n)
+            SEMP - SEM / mean
+    """
+
+    n = np.sum(~np.isnan(mune), axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.nansum(mune, axis=-1) / n
+        sd = np.sqrt(np.nansum((mune - mean[..., None])**2, axis=-1) / (n - 1))
+        sdc = sd * np.sqrt(2) * 1.96
+        sem = sd / np.sqrt(n)
+        return {"n": n, "mean": mean, "SD": sd, "COV": sd / mean, "SDC": sdc, "SDCP": sdc / mean, "SEM": sem, "SEMP": sem / mean}
+
+
 def sdc(paths):
-    sd_str_combined = ''
-    cov_str_combined = ''
-    sdc_str_combined = ''
-    sdcp_str_combined = ''
-    sem_str_combined = ''
-    semp_str_combined = ''
-    for path in paths:
-        df = pd.read_csv(f"{DIR_IN}/{path}/MUNE.csv", index_col=0)
-        sd_str = ''
-        cov_str = ''
-        sdc_str = ''
-        sdcp_str = ''
-        sem_str = ''
-        semp_str = ''
-        for i in df:
-            col = df.filter([i]).values
-            mean = np.mean(col)
-            var = np.var(col, ddof=1)
-            sd = np.sqrt(var)
-            sd_str += f"{sd},"
-            cov = sd/mean
-            cov_str += f"{cov},"
-            sdc = sd * np.sqrt(2) * 1.96
-            sdc_str += f"{sdc},"
-            sdcp = sdc/mean
-            sdcp_str += f"{sdcp},"
-            # sem = 
-            # sem_str += f"{sem},"
-            # semp = sem/mean
-            # semp_str += f"{semp},"
-        with open(f"{DIR_IN}/{path}/SDpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(sd_str)
-        with open(f"{DIR_IN}/{path}/COVpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(cov_str)
-        with open(f"{DIR_IN}/{path}/SDCpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(sdc_str)
-        with open(f"{DIR_IN}/{path}/SDCPpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(sdcp_str)
-        with open(f"{DIR_IN}/{path}/SEMpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(sem_str)
-        with open(f"{DIR_IN}/{path}/SEMpyMUNE.csv", 'w') as file:
-            file.write("5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-            file.write(semp_str)
-        sd_str_combined += f"{path},{sd_str}\n" 
-        cov_str_combined += f"{path},{cov_str}\n"
-        sdc_str_combined += f"{path},{sdc_str}\n"
-        sdcp_str_combined += f"{path},{sdcp_str}\n"
-        sem_str_combined += f"{path},{sem_str}\n"
-        sem_str_combined += f"{path},{semp_str}\n"
-    with open(f"{DIR_IN}/SDpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(sd_str_combined)
-    with open(f"{DIR_IN}/COVpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(cov_str_combined)
-    with open(f"{DIR_IN}/SDCpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(sdc_str_combined)
-    with open(f"{DIR_IN}/SDCPpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(sdcp_str_combined)
-    with open(f"{DIR_IN}/SEMpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(sem_str_combined)
-    with open(f"{DIR_IN}/SEMpyMUNE.csv", 'w') as file:
-        file.write(", 5MU, 10MU, 20MU, 40MU, 80MU, 160MU\n")
-        file.write(semp_str_combined)
-
-sdc(PATHS)
\ No newline at end of file
+    """ Summarize every condition path in one pass and write the tidy {DIR_IN}/SDC.csv, fanned out to the legacy CSVs """
+
+    mune, mu_counts, _ = load(paths)
+    stats = summarize(mune)
+    tidy = pd.DataFrame({"condition": np.repeat(paths, len(mu_counts)), "mu_count": np.tile(mu_counts, len(paths))})
+    for name, values in stats.items():
+        tidy[name] = values.ravel()
+    tidy.to_csv(f"{DIR_IN}/SDC.csv", index=False)
+    write_legacy(tidy)
+    return tidy
+
+
+def write_legacy(tidy):
+    """ Write the tidy summary as the per-path {stat}pyMUNE.csv files and the combined ones in DIR_IN """
+
+    mu_counts = sorted(tidy["mu_count"].unique())
+    header = ", ".join(f"{mu_count}MU" for mu_count in mu_counts)
+    for stat in STATISTICS:
+        table = tidy.pivot(index="condition", columns="mu_count", values=stat).reindex(index=tidy["condition"].unique(), columns=mu_counts)
+        rows = {path: "".join(f"{value}," for value in values) for path, values in zip(table.index, table.to_numpy())}
+        for path, row in rows.items():
+            with open(f"{DIR_IN}/{path}/{stat}pyMUNE.csv", 'w') as file:
+                file.write(f"{header}\n")
+                file.write(row)
+        with open(f"{DIR_IN}/{stat}pyMUNE.csv", 'w') as file:
+            file.write(f", {header}\n")
+            file.write("".join(f"{path},{row}\n" for path, row in rows.items()))
+
+if __name__ == "__main__":
+    sdc(PATHS)
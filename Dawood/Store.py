@@ -0,0 +1,138 @@
+"""
+    Append-only columnar store for simulated scans. Scans are buffered and written as .npz shards holding the
+    concatenated stimuli, responses and ground-truth thresholds and sizes of many scans plus their offsets;
+    the index-NNNNN.npy written next to every shard maps its (condition, seed, mu_count) keys to their rows, so a
+    flush writes only its own entries.
+"""
+
+import os
+import re
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+INDEX_DTYPE = np.dtype([
+    ("condition", "U64"),   # generic condition path, ie: de-random/re-none/str-0.2
+    ("seed", "i4"),         # model individual
+    ("mu_count", "i4"),     # motor pool size at the time of the scan
+    ("shard", "i4"),        # shard file number
+    ("row", "i4"),          # scan number within the shard
+])
+
+
+class ScanStore:
+
+    def __init__(self, path, shard_size=4096):
+        """ Open (or create) the store in directory path; shard_size is the number of buffered scans per shard """
+
+        self.path = path
+        self.shard_size = shard_size
+        os.makedirs(path, exist_ok=True)
+
+        index_paths = [os.path.join(path, "index.npy")]                 # single index of stores written before per-shard indexes
+        index_paths += [os.path.join(path, name) for name in sorted(os.listdir(path)) if re.fullmatch(r"index-\d{5}\.npy", name)]
+        self.index = np.concatenate([np.empty(0, dtype=INDEX_DTYPE)] + [np.load(index_path) for index_path in index_paths if os.path.exists(index_path)])
+        self._buffer = []
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def append(self, condition, seed, mu_count, stimuli, responses, thresholds, sizes):
+        """ Buffer one scan, writing a shard once shard_size scans are pending """
+
+        self._buffer.append((condition, seed, mu_count,
+                             np.asarray(stimuli, dtype=np.float64), np.asarray(responses, dtype=np.float64),
+                             np.asarray(thresholds, dtype=np.float64), np.asarray(sizes, dtype=np.float64)))
+        if len(self._buffer) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """ Write all buffered scans to a new shard and atomically add its index """
+
+        if not self._buffer:
+            return
+
+        shard = int(self.index["shard"].max()) + 1 if len(self.index) else 0
+        conditions, seeds, mu_counts, stimuli, responses, thresholds, sizes = zip(*self._buffer)
+
+        with open(self._shard_path(shard), "wb") as file:
+            np.savez(file,
+                     stimuli=np.concatenate(stimuli),
+                     responses=np.concatenate(responses),
+                     scan_offsets=np.cumsum([0] + [len(x) for x in stimuli]),
+                     thresholds=np.concatenate(thresholds),
+                     sizes=np.concatenate(sizes),
+                     unit_offsets=np.cumsum([0] + [len(x) for x in sizes]))
+
+        entries = np.empty(len(self._buffer), dtype=INDEX_DTYPE)
+        entries["condition"] = conditions
+        entries["seed"] = seeds
+        entries["mu_count"] = mu_counts
+        entries["shard"] = shard
+        entries["row"] = np.arange(len(self._buffer))
+        self.index = np.concatenate([self.index, entries])
+
+        temp_path = os.path.join(self.path, f"index-{shard:05d}.tmp.npy")
+        np.save(temp_path, entries)
+        os.replace(temp_path, self._index_path(shard))                  # a shard is only visible once its whole index is
+        self._buffer = []
+
+    def keys(self):
+        """ Return the index entries of every stored scan; a key appended twice resolves to its latest scan """
+
+        keys = repack_fields(self.index[["condition", "seed", "mu_count"]])
+        _, last = np.unique(keys[::-1], return_index=True)
+        return self.index[np.sort(len(keys) - 1 - last)]
+
+    def get(self, condition, seed, mu_count):
+        """ Return the stimuli, responses, thresholds and sizes of one scan as a dict """
+
+        match = np.flatnonzero((self.index["condition"] == condition) & (self.index["seed"] == seed) & (self.index["mu_count"] == mu_count))
+        if not len(match):
+            raise KeyError((condition, seed, mu_count))
+        return self._read(self.index[match[-1]])
+
+    def shards(self):
+        """ Return the numbers of every shard in the store """
+
+        return np.unique(self.index["shard"])
+
+    def select(self, condition=None, seed=None, mu_count=None, shard=None):
+        """ Yield (entry, scan) for every stored scan matching the given key fields (or shards), shard by shard """
+
+        entries = self.keys()
+        for field, value in (("condition", condition), ("seed", seed), ("mu_count", mu_count), ("shard", shard)):
+            if value is not None:
+                entries = entries[np.isin(entries[field], value)]
+        for entry in np.sort(entries, order=["shard", "row"]):
+            yield entry, self._read(entry)
+
+    def _read(self, entry):
+        shard = self._load_shard(int(entry["shard"]))
+        row = int(entry["row"])
+        s0, s1 = shard["scan_offsets"][row:row+2]
+        u0, u1 = shard["unit_offsets"][row:row+2]
+        return {"stimuli": shard["stimuli"][s0:s1],
+                "responses": shard["responses"][s0:s1],
+                "thresholds": shard["thresholds"][u0:u1],
+                "sizes": shard["sizes"][u0:u1]}
+
+    def _load_shard(self, shard):
+        if shard not in self._shards:
+            if len(self._shards) >= 8:
+                self._shards.pop(next(iter(self._shards)))      # keep only a few decoded shards in memory
+            with np.load(self._shard_path(shard)) as data:
+                self._shards[shard] = {name: data[name] for name in data.files}
+        return self._shards[shard]
+
+    def _shard_path(self, shard):
+        return os.path.join(self.path, f"shard-{shard:05d}.npz")
+
+    def _index_path(self, shard):
+        return os.path.join(self.path, f"index-{shard:05d}.npy")
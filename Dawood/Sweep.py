@@ -0,0 +1,85 @@
+"""
+    Parallel, resumable executor for independent simulation tasks. Every task is identified by a unique key;
+    completed keys are appended to a checkpoint manifest, so an interrupted sweep picks up where it stopped.
+"""
+
+import os
+import json
+from multiprocessing import Pool
+
+
+def sweep(function, tasks, manifest, processes=None, callback=None, commit=None, checkpoint=1):
+    """ Run function(*args) for every (key, args) in tasks that is not yet recorded in the manifest
+            function - module-level callable executed in the worker processes
+            tasks - dict mapping a unique task key (str) to the argument tuple for function
+            manifest - path of the checkpoint manifest, one JSON line per completed task
+            processes - number of worker processes (None uses every core)
+            callback - optional callable(key, result, done, total) run in this process as each task completes
+            commit - optional callable run before a batch of completed keys is checkpointed, making their results durable
+            checkpoint - number of completed tasks checkpointed (and committed) at once
+
+        Tasks must carry their own seed streams so that results do not depend on scheduling or worker count.
+        Returns the keys completed by this call.
+    """
+
+    finished = read_manifest(manifest)
+    pending = [(function, key, args) for key, args in tasks.items() if key not in finished]
+    done = len(tasks) - len(pending)
+    completed = []
+
+    if not pending:
+        return completed
+
+    directory = os.path.dirname(manifest)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    uncommitted = []
+    with open(manifest, "a") as file, Pool(processes) as pool:
+        for key, result in pool.imap_unordered(_run, pending):
+            if callback is not None:
+                callback(key, result, done + 1, len(tasks))       # handle the result before it is checkpointed
+            uncommitted.append(key)
+            done += 1
+            if len(uncommitted) >= checkpoint:
+                _checkpoint(file, uncommitted, commit)
+                completed += uncommitted
+                uncommitted = []
+        _checkpoint(file, uncommitted, commit)
+        completed += uncommitted
+
+    return completed
+
+
+def read_manifest(manifest):
+    """ Return the set of task keys recorded as complete in the manifest """
+
+    finished = set()
+    if not os.path.exists(manifest):
+        return finished
+
+    with open(manifest, "r") as file:
+        for line in file:
+            try:
+                finished.add(json.loads(line)["task"])
+            except (ValueError, KeyError):
+                pass                                                # ignore a line torn by an interruption
+    return finished
+
+
+def _checkpoint(file, keys, commit):
+    """ Commit the results of keys, then record them in the manifest """
+
+    if not keys:
+        return
+    if commit is not None:
+        commit()                                                    # results reach disk before their keys do
+    for key in keys:
+        file.write(json.dumps({"task": key}) + "\n")
+    file.flush()
+    os.fsync(file.fileno())                                         # a recorded key is never lost to a later crash
+
+
+def _run(task):
+    function, key, args = task
+    return key, function(*args)
@@ -1,11 +1,10 @@
 import tkinter as tk
 from tkinter import ttk  # Importing ttk for Combobox
+import queue
+import threading
 import numpy as np
 from scipy.stats import expon
 from scipy.special import erf
-import plotly.graph_objects as graph
-from io import BytesIO
-from PIL import Image, ImageTk
 
 # Globals relating to the MUNE
 SMUP_MIN = 0.025                # minimnum motor unit amplitude
@@ -13,33 +12,46 @@ RELATIVE_SPREAD = 0.0165        # relative spread, there is no upper or lower bo
 SAMPLES = 450                   # length of simulation
 NOISE = 0.01                    # additive noise deviation, there is no offset in this model
 
-# Global dictionary to store all plot images by re_strength
-plot_images_dict = {}
+POLL_MS = 50                    # interval at which the GUI collects scans from the simulation worker
+
+# Globals relating to the plot
+PLOT_WIDTH = 800
+PLOT_HEIGHT = 550
+PLOT_MARGINS = (80, 50, 30, 60)     # left, top, right and bottom space around the axes (px)
+POINT_RADIUS = 2.5
+POINT_COLOR = "#636efa"
+
+# Scans by re_strength as (mu_count, stimuli, responses), streamed in by the simulation worker
+scans_dict = {}
+scan_queue = queue.Queue()
+cancel_event = threading.Event()
+generation = 0                  # number of the current run; scans of cancelled runs are dropped
 current_image_idx = 0
 current_re_strength = None
 
-def main():
-    global mu_count_0, mu_count, resiliences, rng
+def main(run, cancel, mu_count_0, smup_mean, threshold_mean, threshold_dev, resiliences):
+    """ Simulate the degeneration for every resilience in a worker thread, streaming each scan to scan_queue
+        as (run, re_strength, mu_count, stimuli, responses); stops as soon as cancel is set
+    """
     seed = np.random.randint(1000000)
 
     for re_strength in resiliences:
         re_strength /= 100
         rng = np.random.default_rng(seed=seed)
         mu_sizes = expon.rvs(scale=smup_mean - SMUP_MIN, loc=SMUP_MIN, size=mu_count_0, random_state=rng)
-        plot_images_dict[re_strength] = []  # Initialize list for each re_strength
         mu_sizes = np.sort(mu_sizes)
         while len(mu_sizes) >= 5:
+            if cancel.is_set():
+                return
             mu_count = len(mu_sizes)
 
-            stimuli, responses = scan(mu_sizes)
-            store_plot(stimuli, responses, re_strength)  # Store each plot for the current re_strength
+            stimuli, responses = scan(mu_sizes, rng, threshold_mean, threshold_dev)
+            scan_queue.put((run, re_strength, mu_count, stimuli, responses))
 
             rng = np.random.default_rng(np.random.randint(1000000))
             mu_sizes = degenerate(mu_sizes, mu_count, re_strength)  # Handle degeneration
 
-def scan(mu_sizes):
-    global mu_count, smup_mean, threshold_mean, threshold_dev, rng
-
+def scan(mu_sizes, rng, threshold_mean, threshold_dev):
     mu_count = len(mu_sizes)
     mu_thresholds = rng.normal(threshold_mean, threshold_dev, mu_count)
     mu_devs = mu_thresholds * RELATIVE_SPREAD
@@ -68,52 +80,117 @@ def degenerate(mu_sizes, mu_count, re_strength):
 
     return mu_sizes
 
-def create_plot(stimuli, responses, re_strength):
-    global mu_count
-    fig = graph.Figure()
-    fig.add_trace(graph.Scatter(x=stimuli, y=responses, mode='markers'))
-    fig.update_layout(title=f"CMAP Scan | {mu_count} Motor Units | {re_strength * 100}% Resilience", 
-                      xaxis_title='Stimulus Intensity (mA)', 
-                      yaxis_title='Amplitude (mV)')
-
-    img_data = fig.to_image(format="png")
-    return img_data
-
-# Function to store the Plotly image in the plot_images_dict
-def store_plot(stimuli, responses, re_strength):
-    img_data = create_plot(stimuli, responses, re_strength)
-
-    img = Image.open(BytesIO(img_data))
-    img_tk = ImageTk.PhotoImage(img)
-
-    # Append the generated image to the dictionary for the current re_strength
-    plot_images_dict[re_strength].append(img_tk)
-
-# Function to display the current image
+def nice_limits(values, ticks=6):
+    """ Return (low, high, step) of an axis covering values with about ticks round steps of 1, 2 or 5 x 10^n """
+    low, high = float(np.min(values)), float(np.max(values))
+    if high <= low:
+        low, high = low - 0.5, high + 0.5
+    magnitude = 10 ** np.floor(np.log10((high - low) / ticks))
+    step = next(magnitude * m for m in (1, 2, 5, 10) if (high - low) / (magnitude * m) <= ticks)
+    return np.floor(low / step) * step, np.ceil(high / step) * step, step
+
+class ScanCanvas(tk.Canvas):
+    """ Scatter plot of a scan drawn directly onto a Tk canvas in two layers: the axes are kept while a new scan fits
+        inside them and fills at least half of each, and showing another scan moves the existing points of the data layer """
+
+    def __init__(self, master):
+        super().__init__(master, width=PLOT_WIDTH, height=PLOT_HEIGHT, background="white", highlightthickness=0)
+        self.limits = None
+        self.points = []
+        left, top, right, bottom = PLOT_MARGINS
+        self.title = self.create_text(PLOT_WIDTH / 2, top / 2, font=("TkDefaultFont", 12))
+        self.create_text((left + PLOT_WIDTH - right) / 2, PLOT_HEIGHT - bottom / 4, text="Stimulus Intensity (mA)", anchor="s")
+        self.create_text(left / 4, (top + PLOT_HEIGHT - bottom) / 2, text="Amplitude (mV)", angle=90, anchor="n")
+
+    def show(self, stimuli, responses, title):
+        limits = nice_limits(stimuli) + nice_limits(responses)
+        if not self.fits(limits):
+            self.draw_axes(limits)
+
+        x, y = self.to_canvas(np.asarray(stimuli), np.asarray(responses))
+        while len(self.points) < len(x):
+            self.points.append(self.create_oval(0, 0, 0, 0, fill=POINT_COLOR, outline="", tags="data"))
+        for point, px, py in zip(self.points, x, y):
+            self.coords(point, px - POINT_RADIUS, py - POINT_RADIUS, px + POINT_RADIUS, py + POINT_RADIUS)
+            self.itemconfigure(point, state="normal")
+        for point in self.points[len(x):]:
+            self.itemconfigure(point, state="hidden")
+        self.itemconfigure(self.title, text=title)
+
+    def clear(self):
+        self.itemconfigure("data", state="hidden")
+        self.itemconfigure(self.title, text="")
+
+    def fits(self, limits):
+        if self.limits is None:
+            return False
+        for low, high, current_low, current_high in ((limits[0], limits[1], self.limits[0], self.limits[1]),
+                                                     (limits[3], limits[4], self.limits[3], self.limits[4])):
+            if low < current_low or high > current_high or (high - low) < (current_high - current_low) / 2:
+                return False
+        return True
+
+    def draw_axes(self, limits):
+        self.limits = limits
+        self.delete("axes")
+        left, top, right, bottom = PLOT_MARGINS
+        x_low, x_high, x_step, y_low, y_high, y_step = limits
+        self.create_rectangle(left, top, PLOT_WIDTH - right, PLOT_HEIGHT - bottom, outline="black", tags="axes")
+
+        for tick in np.arange(x_low, x_high + x_step / 2, x_step):
+            px, _ = self.to_canvas(tick, y_low)
+            self.create_line(px, PLOT_HEIGHT - bottom, px, PLOT_HEIGHT - bottom + 5, tags="axes")
+            self.create_text(px, PLOT_HEIGHT - bottom + 8, text=f"{tick:.10g}", anchor="n", tags="axes")
+        for tick in np.arange(y_low, y_high + y_step / 2, y_step):
+            _, py = self.to_canvas(x_low, tick)
+            self.create_line(left - 5, py, left, py, tags="axes")
+            self.create_text(left - 8, py, text=f"{tick:.10g}", anchor="e", tags="axes")
+        self.tag_raise("data")
+
+    def to_canvas(self, x, y):
+        left, top, right, bottom = PLOT_MARGINS
+        x_low, x_high, _, y_low, y_high, _ = self.limits
+        px = left + (x - x_low) / (x_high - x_low) * (PLOT_WIDTH - left - right)
+        py = PLOT_HEIGHT - bottom - (y - y_low) / (y_high - y_low) * (PLOT_HEIGHT - top - bottom)
+        return px, py
+
+# Function to display the current scan
 def display_plot():
-    global current_image_idx, current_re_strength
-
-    if current_re_strength in plot_images_dict and plot_images_dict[current_re_strength]:
-        plot_label.config(image=plot_images_dict[current_re_strength][current_image_idx])
-        plot_label.image = plot_images_dict[current_re_strength][current_image_idx]
+    if current_image_idx < len(scans_dict.get(current_re_strength, [])):
+        mu_count, stimuli, responses = scans_dict[current_re_strength][current_image_idx]
+        plot_canvas.show(stimuli, responses, f"CMAP Scan | {mu_count} Motor Units | {current_re_strength * 100}% Resilience")
+
+# Function to collect the scans streamed by the worker, showing the selected one as soon as it arrives
+def poll_scans():
+    try:
+        while True:
+            run, re_strength, mu_count, stimuli, responses = scan_queue.get_nowait()
+            if run != generation:
+                continue        # from a cancelled run
+            scans_dict.setdefault(re_strength, []).append((mu_count, stimuli, responses))
+            if re_strength == current_re_strength and len(scans_dict[re_strength]) == current_image_idx + 1:
+                display_plot()
+    except queue.Empty:
+        pass
+    root.after(POLL_MS, poll_scans)
 
 # Function to navigate to the next plot
 def next_plot():
-    global current_image_idx, current_re_strength
-    if current_re_strength in plot_images_dict and current_image_idx < len(plot_images_dict[current_re_strength]) - 1:
+    global current_image_idx
+    if current_image_idx < len(scans_dict.get(current_re_strength, [])) - 1:
         current_image_idx += 1
         display_plot()
 
 # Function to navigate to the previous plot
 def previous_plot():
-    global current_image_idx, current_re_strength
-    if current_re_strength in plot_images_dict and current_image_idx > 0:
+    global current_image_idx
+    if current_re_strength in scans_dict and current_image_idx > 0:
         current_image_idx -= 1
         display_plot()
 
 # Function to handle the submission of the values and start the scan
 def generate_scans():
-    global mu_count_0, smup_mean, threshold_mean, threshold_dev, resiliences
+    global cancel_event, generation, current_image_idx
 
     mu_count_0 = int(entry_mu_count.get())
     smup_mean = float(entry_smup_mean.get()) / 1000
@@ -123,9 +200,15 @@ def generate_scans():
     # Convert resiliences input to a list of floats
     resiliences = list(map(float, entry_resiliences.get().split(",")))
 
-    # Perform the scan and store plots
-    main()
-    
+    # Cancel the previous run and start the scans in the background, plots are drawn as they are viewed
+    cancel_event.set()
+    cancel_event = threading.Event()
+    generation += 1
+    scans_dict.clear()
+    current_image_idx = 0
+    plot_canvas.clear()
+    threading.Thread(target=main, args=(generation, cancel_event, mu_count_0, smup_mean, threshold_mean, threshold_dev, resiliences), daemon=True).start()
+
     # Populate the dropdown with resiliences
     resiliences_combobox['values'] = resiliences  # Set the values for the dropdown
     if resiliences:  # Automatically select the first re_strength if available
@@ -169,9 +252,9 @@ for idx, label_text in enumerate(labels):
     entry.grid(row=idx, column=1, padx=10, pady=5)
     entries.append(entry)
 
-# Create a label for the plot
-plot_label = tk.Label(frame)
-plot_label.grid(row=len(labels) + 1, columnspan=2, pady=10)
+# Create a canvas for the plot
+plot_canvas = ScanCanvas(frame)
+plot_canvas.grid(row=len(labels) + 1, columnspan=2, pady=10)
 
 # Create a label for the resilience dropdown
 label_resilience = tk.Label(frame, text="Select Resilience (%):")
@@ -200,5 +283,6 @@ previous_button.grid(row=len(labels) + 3, column=0, pady=10)
 next_button = tk.Button(frame, text="Next", command=next_plot)
 next_button.grid(row=len(labels) + 3, column=1, pady=10)
 
-# Start the Tkinter event loop
+# Collect scans from the simulation worker and start the Tkinter event loop
+root.after(POLL_MS, poll_scans)
 root.mainloop()
\ No newline at end of file